@@ -0,0 +1,316 @@
+""" Benchmarks of the decoding & export, on a synthetic project.
+
+    python -m benchmarks -h
+
+Every benchmark runs 'repeat' times, the fastest run is reported, as
+throughput of decoded data (MB/s) and of frames/images (frames/s). Save the
+results with --json, and compare a later run with --compare to see
+regressions. With --check the fast paths are compared with the plain ones
+instead (see checks).
+
+Issued under the "do what you like with it - I take no responsibility" licence
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from tvpexport import decoders
+from tvpexport.parser import TvpProject
+from tvpexport.data_handlers import Clip
+from . import checks
+from . import synthetic
+
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+MB = 1024 * 1024
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def best_time(func, repeat, setup=None):
+    """ Return the fastest time of 'repeat' runs.
+
+    Args:
+        func (function): the benchmarked function, gets the result of setup
+        repeat (int): amount of runs
+        setup (function): called before every run, not timed
+
+    Returns:
+        float: seconds
+    """
+    times = []
+    for _i in range(repeat):
+        value = setup() if setup is not None else None
+        start_time = time.perf_counter()
+        func(value)
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def open_clip(project_path):
+    return Clip(TvpProject(project_path))
+
+
+def num_frames(clip):
+    return sum(layer.settings["end_frame"] - layer.settings["start_frame"] + 1
+               for layer in clip.layers)
+
+
+def frame_bytes(clip):
+    return clip.width * clip.height * 4
+
+
+def painted_images(clip):
+    """ Return the images that hold imagedata (no repeats), unzipped. """
+    images = []
+    for layer in clip.layers:
+        for image in layer.images:
+            _trigger_unzip = image.raw_data  # this sets the actual type
+            if image.type == "DBOD" or image.first_info not in (2, 6):
+                images.append(image)
+    return images
+
+
+def bench_unpack_RLE(project_path, repeat):
+    """ unpack_RLE on all RLE-data: the DBOD-images and the RLE-tiles. """
+    rle_data = []
+    for image in painted_images(open_clip(project_path)):
+        if image.type == "DBOD":
+            rle_data.append(bytes(image.raw_data))
+        else:
+            rle_data.extend(bytes(tile.rle_data) for tile in image.tiles if tile.rle_data)
+    decoded_size = sum(len(decoders.unpack_RLE(data)) for data in rle_data)
+
+    def run(_value):
+        for data in rle_data:
+            decoders.unpack_RLE(data)
+
+    return best_time(run, repeat), decoded_size, None
+
+
+def bench_decode_ZCHK(project_path, repeat):
+    """ decode_ZCHK on all zipped images. """
+    clip = open_clip(project_path)
+    zchk_data = [
+        bytes(clip.tvptree.read_data(image.data_offset, image.data_size))
+        for layer in clip.layers for image in layer.images if image.type == "ZCHK"
+    ]
+    if not zchk_data:
+        return None
+    decoded_size = sum(len(decoders.decode_ZCHK(data)) for data in zchk_data)
+
+    def run(_value):
+        for data in zchk_data:
+            decoders.decode_ZCHK(data)
+
+    return best_time(run, repeat), decoded_size, None
+
+
+def bench_tile_sources(project_path, repeat):
+    """ Resolving the tile-sources of all images (the chunk-data is read and
+    unzipped in the setup), reported as images/s.
+    """
+    def setup():
+        clip = open_clip(project_path)
+        for image in painted_images(clip):
+            _trigger_unzip = image.tiles
+        return clip
+
+    def run(clip):
+        for layer in clip.layers:
+            for image_index in range(len(layer.images)):
+                layer.tile_sources(image_index)
+
+    clip = setup()
+    num_images = sum(len(layer.images) for layer in clip.layers)
+    return best_time(run, repeat, setup), None, num_images
+
+
+def bench_frame(project_path, repeat):
+    """ Layer.frame on all frames of all layers, in random order. """
+    clip = open_clip(project_path)
+    order = [
+        (layer.index, index)
+        for layer in clip.layers
+        for index in range(layer.settings["start_frame"], layer.settings["end_frame"] + 1)
+    ]
+    random.Random(1).shuffle(order)
+
+    def run(clip):
+        for layer_index, index in order:
+            clip.layers[layer_index].frame(index)
+
+    seconds = best_time(run, repeat, lambda: open_clip(project_path))
+    return seconds, len(order) * frame_bytes(clip), len(order)
+
+
+def bench_iter_frames(project_path, repeat):
+    """ Layer.iter_frames over all frames of all layers. """
+    clip = open_clip(project_path)
+
+    def run(clip):
+        for layer in clip.layers:
+            settings = layer.settings
+            for _frame in layer.iter_frames(settings["start_frame"], settings["end_frame"] + 1):
+                pass
+
+    seconds = best_time(run, repeat, lambda: open_clip(project_path))
+    return seconds, num_frames(clip) * frame_bytes(clip), num_frames(clip)
+
+
+def bench_export(project_path, repeat, export_args=()):
+    """ A full CLI-export of all layers to png (python -m tvpexport). """
+    clip = open_clip(project_path)
+
+    def run(output_dir):
+        subprocess.run(
+            [sys.executable, "-m", "tvpexport", project_path, "-a", "-o", output_dir]
+            + list(export_args),
+            cwd=PACKAGE_ROOT, check=True, stdout=subprocess.DEVNULL
+        )
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        seconds = best_time(run, repeat, lambda: output_dir)
+    return seconds, num_frames(clip) * frame_bytes(clip), num_frames(clip)
+
+
+BENCHMARKS = {
+    "unpack_RLE": bench_unpack_RLE,
+    "decode_ZCHK": bench_decode_ZCHK,
+    "tile_sources": bench_tile_sources,
+    "frame": bench_frame,
+    "iter_frames": bench_iter_frames,
+    "export": bench_export,
+}
+
+
+def run_benchmarks(project_path, names, repeat):
+    """ Run benchmarks on a project.
+
+    Args:
+        project_path (str): path of the project
+        names (list): names of the benchmarks (see BENCHMARKS)
+        repeat (int): runs per benchmark
+
+    Returns:
+        dict: name: {"seconds", "mb_per_s", "frames_per_s"}
+    """
+    results = {}
+    for name in names:
+        logger.info(f"Running {name} ...")
+        result = BENCHMARKS[name](project_path, repeat)
+        if result is None:
+            logger.info(f"Skipped {name}, the project has no data for it.")
+            continue
+        seconds, num_bytes, num_items = result
+        results[name] = {
+            "seconds": seconds,
+            "mb_per_s": num_bytes / MB / seconds if num_bytes else None,
+            "frames_per_s": num_items / seconds if num_items else None,
+        }
+    return results
+
+
+def print_results(results, previous=None):
+    """ Print a table of the results, with the change to previous results. """
+    def number(value):
+        return f"{value:12.1f}" if value is not None else f"{'-':>12}"
+
+    def change(name, key):
+        if not previous or name not in previous:
+            return ""
+        old, new = previous[name].get(key), results[name][key]
+        if not old or not new:
+            return ""
+        return f" ({(new - old) / old * 100:+.1f}%)"
+
+    print(f"{'benchmark':<14}{'seconds':>12}{'MB/s':>12}{'frames/s':>12}")
+    for name, result in results.items():
+        print(
+            f"{name:<14}{result['seconds']:12.4f}"
+            f"{number(result['mb_per_s'])}{change(name, 'mb_per_s')}"
+            f"{number(result['frames_per_s'])}{change(name, 'frames_per_s')}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark tvpexport on a synthetic project."
+    )
+    parser.add_argument("--width", type=int, default=1920, help="canvas-width")
+    parser.add_argument("--height", type=int, default=1080, help="canvas-height")
+    parser.add_argument("--layers", type=int, default=4, help="amount of layers")
+    parser.add_argument("--frames", type=int, default=24, help="amount of frames per layer")
+    parser.add_argument(
+        "--hold_ratio", type=float, default=0.25,
+        help="part of the frames that repeat an earlier image"
+    )
+    parser.add_argument(
+        "--sparsity", type=float, default=0.5, help="part of the tiles that is empty"
+    )
+    parser.add_argument(
+        "--change_ratio", type=float, default=0.2,
+        help="part of the painted tiles that changes per image"
+    )
+    parser.add_argument(
+        "--raw", action="store_true", help="store the images as raw chunks, not zipped(ZCHK)"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="seed of the generated content")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark")
+    parser.add_argument(
+        "--only", nargs="+", choices=list(BENCHMARKS), help="run only these benchmarks"
+    )
+    parser.add_argument(
+        "--project", type=str,
+        help="write the synthetic project here (and keep it), or use this project when it exists"
+    )
+    parser.add_argument("--json", type=str, help="save the results to this json-file")
+    parser.add_argument("--compare", type=str, help="compare with the results of a json-file")
+    parser.add_argument(
+        "--check", nargs="*", choices=list(checks.CHECKS),
+        help="only check that the fast paths decode the same as the plain ones "
+             "(default all checks), exits with 1 on a difference"
+    )
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    logging.getLogger("tvpexport").setLevel(logging.WARNING)
+
+    if args.check is not None:
+        sys.exit(0 if checks.run_checks(args.check) else 1)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        project_path = args.project or os.path.join(temp_dir, "synthetic.tvpp")
+        if not os.path.exists(project_path):
+            logger.info(f"Writing synthetic project {project_path} ...")
+            synthetic.write_project(
+                project_path, width=args.width, height=args.height,
+                num_layers=args.layers, num_frames=args.frames,
+                hold_ratio=args.hold_ratio, use_zchk=not args.raw,
+                sparsity=args.sparsity, change_ratio=args.change_ratio, seed=args.seed
+            )
+        results = run_benchmarks(project_path, args.only or list(BENCHMARKS), args.repeat)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r") as results_file:
+            previous = json.load(results_file)
+    print_results(results, previous)
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
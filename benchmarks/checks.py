@@ -0,0 +1,193 @@
+""" Checks of the optimized decoding, on generated data.
+
+    python -m benchmarks --check
+
+The fast paths have to give the same output as the plain ones. These checks
+compare them, so tuning (like the RLE-thresholds in decoders) can not change
+the decoded data unnoticed. The memory-limit (max_memory) is checked to not
+make the export read&unzip the same chunks over and over.
+
+Issued under the "do what you like with it - I take no responsibility" licence
+"""
+
+import os
+import sys
+import random
+import logging
+import tempfile
+import numpy as np
+
+from tvpexport import decoders
+from tvpexport.parser import TvpProject
+from tvpexport.data_handlers import Clip
+from tvpexport.profiling import profiler
+
+from . import synthetic
+
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def random_RLE_stream(rng, num_packets, literal_ratio):
+    """ Return a random RLE packet-stream.
+
+    Besides runs and literals of every length, the stream can have the
+    unused control-bytes (0x7C..0x84), and a last packet that is cut off or
+    a padding-byte, like the edge-cases in files.
+
+    Args:
+        rng (random.Random): random-generator
+        num_packets (int): amount of packets
+        literal_ratio (float): part of the packets that is a literal
+
+    Returns:
+        bytes
+    """
+    data = bytearray()
+    for _i in range(num_packets):
+        kind = rng.random()
+        if kind < 0.01:
+            data.append(rng.randrange(0x7C, 0x85))
+        elif kind < literal_ratio:
+            num_pixels = rng.randrange(1, 125)
+            data.append(num_pixels - 1)
+            data += rng.randbytes(num_pixels * 4)
+        else:
+            data.append(257 - rng.randrange(2, 125))
+            data += rng.randbytes(4)
+    ending = rng.random()
+    if ending < 0.1 and data:
+        del data[-rng.randrange(1, min(len(data), 8) + 1):]  # cut off
+    elif ending < 0.2:
+        data.append(0)  # padding
+    return bytes(data)
+
+
+def check_unpack_RLE(num_streams=500, seed=1):
+    """ Compare unpack_RLE, and its numpy-path, with the packet-loop on
+    random streams of 1..4096 packets (on both sides of the thresholds).
+
+    Args:
+        num_streams (int): amount of streams
+        seed (int): seed of the random-generator
+
+    Returns:
+        list: descriptions of the streams that differ, empty when all match
+    """
+    rng = random.Random(seed)
+    failures = []
+    for stream_index in range(num_streams):
+        num_packets = int(2 ** rng.uniform(0, 12))
+        data = random_RLE_stream(rng, num_packets, rng.random())
+        expected = np.frombuffer(decoders._unpack_RLE_loop(data), dtype=np.uint8)
+        for name, func in (
+            ("unpack_RLE", decoders.unpack_RLE),
+            ("_unpack_RLE_numpy", decoders._unpack_RLE_numpy),
+        ):
+            if not np.array_equal(func(data), expected):
+                failures.append(
+                    f"{name} differs on stream {stream_index} "
+                    f"({num_packets} packets, {len(data)} bytes, seed {seed})"
+                )
+    return failures
+
+
+# a sequential export may unzip a chunk a bit more than once (for example the
+# start of a chunk for the image-type), not once per tile or per frame
+MAX_INFLATES_PER_CHUNK = 1.5
+
+
+def _count_inflates(clip, iterate):
+    """ Export all frames of the first layer of 'clip', and count the calls
+    of decode_ZCHK.
+
+    Args:
+        clip (Clip()): the clip
+        iterate (bool): use Layer.iter_frames, else Layer.frame per frame
+
+    Returns:
+        int: amount of inflates
+        list: the frames (copies)
+    """
+    layer = clip.layers[0]
+    stop = layer.settings["start_frame"] + len(layer.images)
+    was_enabled = profiler.enabled
+    saved = profiler.snapshot()
+    profiler.enabled = True
+    try:
+        if iterate:
+            frames = [frame.copy() for _index, frame in layer.iter_frames(0, stop)]
+        else:
+            frames = [layer.frame(index).copy() for index in range(stop)]
+        inflates = profiler.snapshot().get("inflate", {}).get("calls", 0)
+    finally:
+        profiler.enabled = was_enabled
+        profiler.merge(saved)
+    return inflates, frames
+
+
+def check_max_memory_inflates(num_frames=30, seed=1):
+    """ Export a synthetic layer with a max_memory that is smaller than a
+    frame, and check that every ZCHK-chunk is unzipped about once (see
+    MAX_INFLATES_PER_CHUNK), and that the frames are the same as without a
+    limit.
+
+    Args:
+        num_frames (int): amount of images of the layer
+        seed (int): seed of the random-generator
+
+    Returns:
+        list: descriptions of the failures, empty when all is well
+    """
+    width, height = 640, 360
+    max_memory = width * height * 4  # the size of one frame
+    failures = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        project_path = os.path.join(temp_dir, "max_memory.tvpp")
+        synthetic.write_project(
+            project_path, width=width, height=height, num_layers=1,
+            num_frames=num_frames, seed=seed
+        )
+        project = TvpProject(project_path)
+        _inflates, expected = _count_inflates(Clip(project), iterate=False)
+        for iterate in (False, True):
+            name = "iter_frames" if iterate else "frame"
+            clip = Clip(project, max_memory=max_memory)
+            num_chunks = sum(image.type == "ZCHK" for image in clip.layers[0].images)
+            inflates, frames = _count_inflates(clip, iterate)
+            if inflates > num_chunks * MAX_INFLATES_PER_CHUNK:
+                failures.append(
+                    f"{name} with max_memory {max_memory}: {inflates} inflates "
+                    f"of {num_chunks} ZCHK-chunks"
+                )
+            if any(not np.array_equal(a, b) for a, b in zip(frames, expected)):
+                failures.append(f"{name} with max_memory {max_memory} gives other frames")
+    return failures
+
+
+CHECKS = {
+    "unpack_RLE": check_unpack_RLE,
+    "max_memory_inflates": check_max_memory_inflates,
+}
+
+
+def run_checks(names=None):
+    """ Run checks, and log the failures.
+
+    Args:
+        names (list): names of the checks (see CHECKS), default all
+
+    Returns:
+        bool: True when all checks passed
+    """
+    passed = True
+    for name in names or list(CHECKS):
+        logger.info(f"Checking {name} ...")
+        failures = CHECKS[name]()
+        for failure in failures:
+            logger.error(failure)
+        passed = passed and not failures
+    return passed
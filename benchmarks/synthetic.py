@@ -0,0 +1,361 @@
+""" Write synthetic tvpaint-projects, to benchmark with.
+
+The projects have the container-structure that TvpProject.process expects
+(project, scene, clip, clip-data) and a clip-data FORM with layers of
+DBOD/SRAW-images, optionally zipped (ZCHK). The content is generated: every
+layer paints rectangles on a part of the tiles, and the next images repaint
+some of those tiles. With the settings you can steer the canvas-size, the
+amount of layers&frames, the amount of holds (repeated images), the
+compression (ZCHK or raw chunks) and how sparse the layers are.
+
+Issued under the "do what you like with it - I take no responsibility" licence
+"""
+
+import sys
+import random
+import struct
+import zlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+TILE_SIZE = 64
+# node-type: header-bytes, see TvpProject.headers
+NODE_HEADERS = {
+    "project": (0x33, 0x84, 0x78, 0x0E),
+    "utf16-projectinfo": (0x33, 0x85, 0x55, 0x3A),
+    "thumbnail": (0x33, 0x8C, 0x4E, 0xE4),
+    "utf16-thumbnailinfo": (0x33, 0x8A, 0x96, 0x08),
+    "thumbnail-data": (0x33, 0x8B, 0x71, 0x54),
+    "scene": (0x33, 0x86, 0x31, 0xB2),
+    "utf16-scene-info": (0x33, 0x88, 0xDA, 0x98),
+    "clip": (0x33, 0x89, 0xB8, 0x46),
+    "utf16-clip-info": (0x33, 0x87, 0xE3, 0x4A),
+    "clip-data": (0x33, 0x87, 0x11, 0x54),
+}
+NODE_MAGIC = bytes((0x00, 0x0F, 0x1F, 0x02, 0x19, 0x1B))
+HOST = "TVPaint Animation 11 Pro (11.5)"  # 11: pixeldata is RGBA
+ZCHK_BLOCK_SIZE = 65536
+RLE_MAX_PIXELS = 124  # per packet, for runs and literals
+THUMBNAIL_SCALE = 8  # the thumbnails are 1/8 of the canvas
+
+
+def encode_node(node_type, payload):
+    """ Return a node: 24 header-bytes (type, validation, size) and the payload. """
+    return (
+        bytes(NODE_HEADERS[node_type]) + bytes(6) + NODE_MAGIC
+        + struct.pack(">Q", len(payload)) + payload
+    )
+
+
+def encode_utf16_dict(info):
+    """ Encode a dict of strings, see decoders.parse_utf16_dictdata. """
+    data = bytearray(struct.pack(">I", len(info)))
+    for key, value in info.items():
+        for text in (key, value):
+            encoded = text.encode("utf-16be")
+            data += struct.pack(">H", len(encoded) // 2) + encoded
+    return bytes(data)
+
+
+def encode_chunk(ident, data):
+    """ Return an IFF-chunk, padded to an even size. """
+    chunk = ident.encode("ascii") + struct.pack(">I", len(data)) + data
+    if len(data) % 2:
+        chunk += b"\0"
+    return chunk
+
+
+def encode_RLE(pixels):
+    """ RLE-compress imagedata, see decoders.unpack_RLE.
+
+    Runs of equal pixels become run-packets, the pixels in between are
+    stored as literal-packets.
+
+    Args:
+        pixels (np.ndarray): (height, width, 4) uint8 image-data
+
+    Returns:
+        bytes
+    """
+    pixels = np.ascontiguousarray(pixels)
+    values = pixels.view(np.uint32).ravel()
+    raw = pixels.tobytes()
+    num_pixels = len(values)
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    lengths = np.diff(np.r_[starts, num_pixels])
+
+    data = bytearray()
+
+    def add_literal(start, stop):
+        while start < stop:
+            count = min(stop - start, RLE_MAX_PIXELS)
+            data.append(count - 1)
+            data.extend(raw[4 * start : 4 * (start + count)])
+            start += count
+
+    literal_start = None
+    for start, length in zip(starts.tolist(), lengths.tolist()):
+        if length == 1:
+            if literal_start is None:
+                literal_start = start
+            continue
+        if literal_start is not None:
+            add_literal(literal_start, start)
+            literal_start = None
+        while length > 1:
+            count = min(length, RLE_MAX_PIXELS)
+            if length - count == 1:
+                count -= 1  # don't leave a single pixel behind
+            data.append(257 - count)
+            data.extend(raw[4 * start : 4 * start + 4])
+            start += count
+            length -= count
+    if literal_start is not None:
+        add_literal(literal_start, num_pixels)
+    return bytes(data)
+
+
+def encode_ZCHK(ident, payload):
+    """ Zip an image-chunk, see decoders.decode_ZCHK. """
+    inner = ident.encode("ascii") + struct.pack(">I", len(payload)) + payload
+    data = bytearray(16) + struct.pack(">I", -(-len(inner) // ZCHK_BLOCK_SIZE))
+    for position in range(0, len(inner), ZCHK_BLOCK_SIZE):
+        block = inner[position : position + ZCHK_BLOCK_SIZE]
+        zblock = zlib.compress(block)
+        data += bytes(4) + struct.pack(">II", len(block), len(zblock)) + zblock
+    return bytes(data)
+
+
+def thumbnail_size(width, height):
+    """ Return the (width, height) of the thumbnails: 1/THUMBNAIL_SCALE of the
+    canvas, with its aspect-ratio.
+    """
+    if width >= height:
+        thumb_height = max(1, height // THUMBNAIL_SCALE)
+        return max(1, round(thumb_height * width / height)), thumb_height
+    thumb_width = max(1, width // THUMBNAIL_SCALE)
+    return thumb_width, max(1, round(thumb_width * height / width))
+
+
+def encode_LRHD(start_frame, num_images, blend_mode=0):
+    """ Layer-settings, see decoders.decode_LRHD. """
+    settings = [0] * 52
+    settings[3] = start_frame
+    settings[5] = start_frame + num_images - 1
+    settings[7] = num_images
+    settings[9] = 255  # opacity
+    settings[31] = blend_mode
+    return struct.pack(">52H", *settings)
+
+
+class LayerPainter(object):
+    """ Paints the images of a synthetic layer.
+
+    Only the 'painted' tiles get content (1 - sparsity of all tiles), the other
+    tiles stay empty. Every new image repaints a part of the painted tiles.
+    """
+
+    def __init__(self, rng, width, height, sparsity=0.5, change_ratio=0.2):
+        self.rng = rng
+        self.width = width
+        self.height = height
+        self.change_ratio = change_ratio
+        self.num_tiles_x = -(-width // TILE_SIZE)
+        self.num_tiles_y = -(-height // TILE_SIZE)
+        num_tiles = self.num_tiles_x * self.num_tiles_y
+        num_painted = max(1, round(num_tiles * (1.0 - sparsity)))
+        self.painted_tiles = sorted(rng.sample(range(num_tiles), num_painted))
+
+    def tile_region(self, tile_index):
+        tile_y, tile_x = divmod(tile_index, self.num_tiles_x)
+        return (
+            slice(tile_y * TILE_SIZE, (tile_y + 1) * TILE_SIZE),
+            slice(tile_x * TILE_SIZE, (tile_x + 1) * TILE_SIZE),
+        )
+
+    def paint_tile(self, image, tile_index):
+        """ Paint a rectangle on a cleared tile, with a flat color or a gradient. """
+        tile = image[self.tile_region(tile_index)]
+        tile[...] = 0
+        height, width = tile.shape[:2]
+        x0 = self.rng.randrange(width // 2 + 1)
+        y0 = self.rng.randrange(height // 2 + 1)
+        x1 = self.rng.randrange(x0 + 1, width + 1)
+        y1 = self.rng.randrange(y0 + 1, height + 1)
+        color = [self.rng.randrange(256) for _i in range(3)] + [self.rng.randrange(1, 256)]
+        tile[y0:y1, x0:x1] = color
+        if self.rng.random() < 0.3:
+            # a gradient gives literal-packets in the RLE-data
+            tile[y0:y1, x0:x1, 0] = np.arange(x1 - x0, dtype=np.uint8)[np.newaxis, :] * 3
+
+    def first_image(self):
+        image = np.zeros(shape=(self.height, self.width, 4), dtype=np.uint8)
+        for tile_index in self.painted_tiles:
+            self.paint_tile(image, tile_index)
+        return image
+
+    def next_image(self, image):
+        image = image.copy()
+        num_changed = max(1, round(len(self.painted_tiles) * self.change_ratio))
+        for tile_index in self.rng.sample(self.painted_tiles, num_changed):
+            self.paint_tile(image, tile_index)
+        return image
+
+    def thumbnail(self, image):
+        """ Return the thumbnail of an image: the image scaled down (nearest
+        pixels) to thumbnail_size.
+        """
+        thumb_width, thumb_height = thumbnail_size(self.width, self.height)
+        rows = np.arange(thumb_height) * self.height // thumb_height
+        columns = np.arange(thumb_width) * self.width // thumb_width
+        return image[rows[:, np.newaxis], columns]
+
+    def encode_SRAW(self, image, previous):
+        """ Encode an image as tiles: unchanged tiles are copies of the previous
+        image, tiles that are equal to an earlier tile of the image are local
+        copies, the others are RLE-compressed. The thumbnail is stored
+        uncompressed.
+        """
+        num_tiles = self.num_tiles_x * self.num_tiles_y
+        thumb = np.ascontiguousarray(self.thumbnail(image)).tobytes()
+        data = bytearray(struct.pack(">II", TILE_SIZE, len(thumb)) + thumb)
+        data += struct.pack(">I", num_tiles)
+        local_tiles = {}  # tile-bytes: first tile-index
+        for tile_index in range(num_tiles):
+            region = self.tile_region(tile_index)
+            tile = image[region]
+            key = (tile.shape, tile.tobytes())
+            if np.array_equal(tile, previous[region]):
+                data += struct.pack(">III", 0, 1, tile_index)
+            elif key in local_tiles:
+                data += struct.pack(">III", 0, 0, local_tiles[key])
+            else:
+                rle_data = encode_RLE(tile)
+                data += struct.pack(">I", len(rle_data)) + rle_data
+            local_tiles.setdefault(key, tile_index)
+        return bytes(data)
+
+
+def generate_layer(
+    rng, layer_index, width, height, num_frames, hold_ratio=0.25, use_zchk=True,
+    sparsity=0.5, change_ratio=0.2, keep_images=False
+):
+    """ Return the chunks of a layer.
+
+    Args:
+        rng (random.Random): random-generator
+        layer_index (int): index of the layer
+        width (int): canvas-width
+        height (int): canvas-height
+        num_frames (int): amount of images
+        hold_ratio (float): part of the images that repeat an earlier image
+        use_zchk (bool): zip the images (ZCHK), else raw DBOD/SRAW-chunks
+        sparsity (float): part of the tiles that stays empty
+        change_ratio (float): part of the painted tiles that changes per image
+        keep_images (bool): return the images too
+
+    Returns:
+        bytes: the chunks
+        list: the images (np.ndarray) per frame, None without keep_images
+    """
+    painter = LayerPainter(rng, width, height, sparsity, change_ratio)
+
+    def image_chunk(ident, payload):
+        if use_zchk:
+            return encode_chunk("ZCHK", encode_ZCHK(ident, payload))
+        return encode_chunk(ident, payload)
+
+    chunks = bytearray(encode_chunk("LNAM", f"layer{layer_index}".encode("utf8") + b"\0"))
+    chunks += encode_chunk("LRHD", encode_LRHD(0, num_frames, blend_mode=0))
+
+    image = painter.first_image()
+    chunks += image_chunk("DBOD", encode_RLE(image))
+    images = [image]
+    for frame in range(1, num_frames):
+        if rng.random() < hold_ratio:
+            if frame > 1 and rng.random() < 0.3:
+                # repeat a specific earlier image
+                repeated = rng.randrange(frame - 1)
+                chunks += encode_chunk("SRAW", struct.pack(">II", 2, repeated))
+                images.append(images[repeated])
+            else:
+                chunks += encode_chunk("SRAW", struct.pack(">II", 6, 0))
+                images.append(images[-1])
+            continue
+        image = painter.next_image(images[-1])
+        chunks += image_chunk("SRAW", painter.encode_SRAW(image, images[-1]))
+        images.append(image)
+    chunks += encode_chunk("LEXT", b"\0\0\0[Images]\n\n")
+    return bytes(chunks), images if keep_images else None
+
+
+def write_project(
+    file_path, width=1920, height=1080, num_layers=4, num_frames=24, hold_ratio=0.25,
+    use_zchk=True, sparsity=0.5, change_ratio=0.2, seed=1, keep_images=False
+):
+    """ Write a synthetic project (one scene, one clip).
+
+    Args:
+        file_path (str): path of the .tvpp-file
+        width (int): canvas-width
+        height (int): canvas-height
+        num_layers (int): amount of layers
+        num_frames (int): amount of images per layer
+        hold_ratio (float): part of the images that repeat an earlier image
+        use_zchk (bool): zip the images (ZCHK), else raw DBOD/SRAW-chunks
+        sparsity (float): part of the tiles that stays empty
+        change_ratio (float): part of the painted tiles that changes per image
+        seed (int): seed of the random-generator, the same settings&seed give
+            the same project
+        keep_images (bool): return the images too
+
+    Returns:
+        list: per layer, the images (np.ndarray) per frame. None without
+            keep_images
+    """
+    rng = random.Random(seed)
+    body = bytearray(encode_chunk("DLOC", struct.pack(">HHHH", width, height, 0, 0)))
+    body += encode_chunk("BGP1", bytes((255, 255, 255, 255)))
+    body += encode_chunk("BGP2", bytes((200, 200, 200, 255)))
+    layer_images = []
+    for layer_index in range(num_layers):
+        chunks, images = generate_layer(
+            rng, layer_index, width, height, num_frames, hold_ratio=hold_ratio,
+            use_zchk=use_zchk, sparsity=sparsity, change_ratio=change_ratio,
+            keep_images=keep_images
+        )
+        body += chunks
+        layer_images.append(images)
+    clip_data = b"FORM" + struct.pack(">I", len(body) + 4) + b"TVPP" + bytes(body)
+
+    clip = encode_node(
+        "clip",
+        encode_node("utf16-clip-info", encode_utf16_dict({"Name": "clip"}))
+        + encode_node("clip-data", clip_data)
+    )
+    scene = encode_node(
+        "scene", encode_node("utf16-scene-info", encode_utf16_dict({"Name": "scene"})) + clip
+    )
+    # the size of the project-thumbnail is the size of the thumbnails of the images
+    thumb_width, thumb_height = thumbnail_size(width, height)
+    thumbnail = encode_node(
+        "thumbnail",
+        encode_node(
+            "utf16-thumbnailinfo",
+            encode_utf16_dict({"Width": str(thumb_width), "Height": str(thumb_height)})
+        )
+        + encode_node("thumbnail-data", bytes(thumb_width * thumb_height * 4))
+    )
+    project_info = encode_node(
+        "utf16-projectinfo", encode_utf16_dict({"Host": HOST, "Name": "synthetic"})
+    )
+    with open(file_path, "wb") as project_file:
+        project_file.write(encode_node("project", project_info + thumbnail + scene))
+    logger.debug(f"Synthetic project was written to {file_path}.")
+    return layer_images if keep_images else None
@@ -5,9 +5,14 @@ import os
 import numpy as np
 import cv2
 import time
+import json
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pprint import pprint
 from .parser import TvpProject
-from .data_handlers import Clip
+from .data_handlers import Clip, SCALES, scaled_size
+from .profiling import profiler
 
 logger = logging.getLogger(__name__)
 handler = logging.StreamHandler(sys.stdout)
@@ -49,16 +54,626 @@ def show_window(tvpp, bg_color, img, timeout=0):
         sys.exit(0)
 
 
-def save_img(tvpp, layer, img, index, output_dir):
+def img_file_name(layer, index):
+    return f"{layer.index:03d}_{index:04d}.png"
+
+
+def save_img(tvpp, layer, img, index, output_dir, writer=None):
+    file_name = img_file_name(layer, index)
+    if writer is not None:
+        writer.write(tvpp, img, output_dir, file_name)
+    else:
+        write_img(tvpp, img, output_dir, file_name)
+
+
+def save_composite(tvpp, img, index, output_dir, writer=None):
+    file_name = f"composite_{index:04d}.png"
+    if writer is not None:
+        writer.write(tvpp, img, output_dir, file_name)
+    else:
+        write_img(tvpp, img, output_dir, file_name)
+
+
+def write_img(tvpp, img, output_dir, file_name, compression=None):
     if not os.path.exists(output_dir):
         raise FileNotFoundError(f"'{output_dir}' does not exist")
 
-    file_name = f"{layer.index:03d}_{index:04d}.png"
     file_path = os.path.join(output_dir, file_name)
     if tvpp.tvpaint_version[0] == 9:
-        img = img[:, :, ::-1]
+        with profiler.measure("color_convert", img.nbytes) as measurement:
+            img = np.ascontiguousarray(img[:, :, ::-1])
+            measurement.bytes_out = img.nbytes
     logger.info(f"Saving to {file_path}.")
-    cv2.imwrite(file_path, img)
+    params = []
+    if compression is not None:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    with profiler.measure("png_encode", img.nbytes) as measurement:
+        cv2.imwrite(file_path, img, params)
+        if profiler.enabled:
+            measurement.bytes_out = os.path.getsize(file_path)
+
+
+class ImageWriter(object):
+    """ Saves images with a pool of threads, so the next frames are decoded
+    while the previous ones are encoded and written (cv2.imwrite releases the
+    GIL).
+
+    At most 'max_pending' images wait to be written: 'write' blocks when
+    there are more (backpressure), so the memory stays bounded. The images are
+    copied, so the caller can reuse its buffer (like Layer.iter_frames does).
+    With 0 workers the images are written right away, in the calling thread.
+    """
+
+    def __init__(self, workers=2, max_pending=None, compression=None):
+        self.workers = workers
+        self.compression = compression
+        self._executor = None
+        if workers > 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="image-writer"
+            )
+        if max_pending is None:
+            max_pending = 2 * max(workers, 1)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def write(self, tvpp, img, output_dir, file_name):
+        """ Save an image (see write_img). """
+        if self._executor is None:
+            write_img(tvpp, img, output_dir, file_name, self.compression)
+            return
+
+        self._check_done()
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(
+                write_img, tvpp, img.copy(), output_dir, file_name, self.compression
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _future: self._slots.release())
+        self._futures.append(future)
+
+    def _check_done(self):
+        """ Raise the error of a failed write, of the writes that are done. """
+        while self._futures and self._futures[0].done():
+            self._futures.popleft().result()
+
+    def flush(self):
+        """ Wait till all images are written. """
+        while self._futures:
+            self._futures.popleft().result()
+
+    def close(self):
+        """ Write the pending images, and stop the threads. """
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+# Project & clip of an export-worker (a process of the pool in 'export_parallel')
+_worker_tvptree = None
+_worker_clip = None
+_worker_writer = None
+_worker_scale = 1
+
+
+def save_repeats(layer, repeats, output_dir, mode):
+    """ Save the repeated frames of a layer as links, or as a timing-manifest.
+
+    The unique frames must be saved already.
+
+    Args:
+        layer (Layer): the layer
+        repeats (dict): timeline-position: position of the first frame with the
+            same image (see Layer.find_repeats)
+        output_dir (str): directory of the images
+        mode (str): 'hardlink', 'symlink' or 'manifest'
+    """
+    if mode == "manifest":
+        manifest = {
+            "layer": layer.index,
+            "name": layer.name,
+            "frames": {
+                str(index): img_file_name(layer, first)
+                for index, first in repeats.items()
+            }
+        }
+        file_path = os.path.join(output_dir, f"{layer.index:03d}_timing.json")
+        logger.info(f"Saving timing-manifest to {file_path}.")
+        with open(file_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        return
+
+    for index, first in repeats.items():
+        if index == first:
+            continue
+        file_path = os.path.join(output_dir, img_file_name(layer, index))
+        if os.path.lexists(file_path):
+            os.remove(file_path)
+        logger.info(f"Linking {file_path} to {img_file_name(layer, first)}.")
+        if mode == "symlink":
+            os.symlink(img_file_name(layer, first), file_path)
+        else:
+            os.link(os.path.join(output_dir, img_file_name(layer, first)), file_path)
+
+
+def _init_export_worker(
+    tvpp_path, scene_index, clip_index, use_mmap, zchk_workers, cache_size,
+    use_index=False, index_dir=None, profile=False, writers=0, png_compression=None,
+    max_memory=None, scale=1
+):
+    """ Open the project in a worker-process.
+
+    Every worker opens the file itself, only the path and indices are sent
+    to the processes (no image-data).
+    """
+    global _worker_tvptree, _worker_clip, _worker_writer, _worker_scale
+    profiler.enabled = profile
+    _worker_scale = scale
+    _worker_writer = ImageWriter(writers, compression=png_compression)
+    _worker_tvptree = TvpProject(
+        tvpp_path, use_mmap=use_mmap, use_index=use_index, index_dir=index_dir
+    )
+    _worker_clip = Clip(
+        _worker_tvptree, scene_index=scene_index, clip_index=clip_index,
+        zchk_workers=zchk_workers, cache_size=cache_size, max_memory=max_memory
+    )
+
+
+def _export_frames(layer_index, frames, output_dir, save=None):
+    """ Export a range of frames of a layer, runs in a worker-process.
+
+    Args:
+        save (set): timeline-positions to save, None saves all frames
+    """
+    layer = _worker_clip.layers[layer_index]
+    start_time = time.time()
+    for i, image in layer.iter_frames(frames.start, frames.stop, scale=_worker_scale):
+        logger.info(
+            f"Layer {layer.index} (\"{layer.name}\") Frame {i}, processing took: {time.time() - start_time:.6f} seconds"
+        )
+        if save is None or i in save:
+            save_img(_worker_tvptree, layer, image, i, output_dir, _worker_writer)
+        start_time = time.time()
+    _worker_writer.flush()
+    return len(frames), profiler.snapshot()
+
+
+def export_parallel(args, clip, layers, scene_index=0, clip_index=0):
+    """ Export the frames of layers with a pool of processes.
+
+    The work is split by layer and by frame-range. The ranges are contiguous
+    so a worker can reuse the images it already constructed for the next
+    frames.
+
+    Args:
+        args (argparse.Namespace): the commandline-arguments
+        clip (Clip): the clip the layers belong to
+        layers (list): the Layer-objects to export
+        scene_index (int): index of the scene of the clip
+        clip_index (int): index of the clip
+    """
+    if not os.path.exists(args.output_dir):
+        raise FileNotFoundError(f"'{args.output_dir}' does not exist")
+
+    repeats = {}
+    if args.frame is not None:
+        frame_ranges = [range(args.frame, args.frame + 1)]
+    else:
+        num_frames = max([l.settings['end_frame'] for l in clip.layers]) + 1
+        # a few ranges per worker, to keep the workers busy till the end.
+        ranges_per_layer = max(1, -(-args.jobs * 4 // len(layers)))
+        range_size = max(1, -(-num_frames // ranges_per_layer))
+        frame_ranges = [
+            range(start, min(start + range_size, num_frames))
+            for start in range(0, num_frames, range_size)
+        ]
+        if args.dedup:
+            for layer in layers:
+                repeats[layer.index] = layer.find_repeats(0, num_frames)
+                # the workers decode the frames, the parent needs no chunk-data
+                for image in layer.images:
+                    image.release_raw_data()
+
+    with ProcessPoolExecutor(
+        max_workers=args.jobs,
+        initializer=_init_export_worker,
+        initargs=(
+            args.tvpp, scene_index, clip_index, args.mmap, args.zchk_workers,
+            cache_size(args), args.index, args.index_dir, profiler.enabled,
+            args.writers, args.png_compression, max_memory(args), args.scale
+        )
+    ) as executor:
+        futures = []
+        for layer in layers:
+            for frames in frame_ranges:
+                save = None
+                if layer.index in repeats:
+                    save = {i for i in frames if repeats[layer.index][i] == i}
+                futures.append(
+                    executor.submit(
+                        _export_frames, layer.index, frames, args.output_dir, save
+                    )
+                )
+        for future in futures:
+            _num_frames, profile_stats = future.result()
+            profiler.merge(profile_stats)
+
+    for layer_index, layer_repeats in repeats.items():
+        save_repeats(clip.layers[layer_index], layer_repeats, args.output_dir, args.dedup)
+
+
+def clip_output_dir(output_dir, scene_index, clip_index):
+    """ Return the output-directory of a clip, when exporting all clips. """
+    return os.path.join(output_dir, f"scene{scene_index:02d}_clip{clip_index:02d}")
+
+
+def export_clip(args, scene_index, clip_index):
+    """ Export one clip to its own directory (see clip_output_dir).
+
+    The clip is an independent unit: the project is opened here, so this can
+    run in a worker-process. Without --layer all layers are exported, with
+    --composite only the composites.
+
+    Args:
+        args (argparse.Namespace): the commandline-arguments
+        scene_index (int): index of the scene of the clip
+        clip_index (int): index of the clip in the scene
+
+    Returns:
+        tuple: scene_index, clip_index, the profiler-counters of the export
+    """
+    profiler.enabled = args.profile or args.profile_json is not None
+    output_dir = clip_output_dir(args.output_dir, scene_index, clip_index)
+    os.makedirs(output_dir, exist_ok=True)
+    with TvpProject(
+        args.tvpp, use_mmap=args.mmap, use_index=args.index, index_dir=args.index_dir
+    ) as tvptree:
+        clip = Clip(
+            tvptree, scene_index=scene_index, clip_index=clip_index,
+            zchk_workers=args.zchk_workers, cache_size=cache_size(args),
+            max_memory=max_memory(args)
+        )
+        if args.frame is not None:
+            frames = range(args.frame, args.frame + 1)
+        else:
+            frames = range(max([l.settings['end_frame'] for l in clip.layers], default=-1) + 1)
+
+        if args.npy:
+            layers = clip.layers
+            if args.layer is not None:
+                layers = clip.layers[args.layer : args.layer + 1]
+            export_npy(args, tvptree, clip, layers, output_dir)
+            return scene_index, clip_index, profiler.snapshot()
+
+        if args.composite:
+            with image_writer(args) as writer:
+                for i in frames:
+                    save_composite(
+                        tvptree, clip.composite_frame(i, args.scale), i, output_dir, writer
+                    )
+            return scene_index, clip_index, profiler.snapshot()
+
+        layers = clip.layers
+        if args.layer is not None:
+            if args.layer >= len(clip.layers):
+                logger.warning(
+                    f"Scene {scene_index}, clip {clip_index} has no layer {args.layer}."
+                )
+                return scene_index, clip_index, profiler.snapshot()
+            layers = [clip.layers[args.layer]]
+
+        with image_writer(args) as writer:
+            for layer in layers:
+                repeats = None
+                if args.dedup and args.frame is None:
+                    repeats = layer.find_repeats(frames.start, frames.stop)
+                for i, image in layer.iter_frames(frames.start, frames.stop, args.scale):
+                    if repeats is None or repeats[i] == i:
+                        save_img(tvptree, layer, image, i, output_dir, writer)
+                if repeats is not None:
+                    writer.flush()  # links need the files of the first frames
+                    save_repeats(layer, repeats, output_dir, args.dedup)
+    return scene_index, clip_index, profiler.snapshot()
+
+
+def export_all_clips(args, tvptree):
+    """ Export all clips of all scenes, the clips are divided over a pool of
+    processes (--jobs).
+
+    Args:
+        args (argparse.Namespace): the commandline-arguments
+        tvptree (TvpProject): the project
+    """
+    if not os.path.exists(args.output_dir):
+        raise FileNotFoundError(f"'{args.output_dir}' does not exist")
+
+    clip_indices = tvptree.get_clip_indices()
+    logger.info(f"Exporting {len(clip_indices)} clip(s).")
+    if args.jobs <= 1 or len(clip_indices) == 1:
+        for scene_index, clip_index in clip_indices:
+            _scene_index, _clip_index, profile_stats = export_clip(
+                args, scene_index, clip_index
+            )
+            profiler.merge(profile_stats)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(args.jobs, len(clip_indices))) as executor:
+        futures = [
+            executor.submit(export_clip, args, scene_index, clip_index)
+            for scene_index, clip_index in clip_indices
+        ]
+        for future in futures:
+            scene_index, clip_index, profile_stats = future.result()
+            profiler.merge(profile_stats)
+            logger.info(f"Scene {scene_index}, clip {clip_index} was exported.")
+
+
+def save_profile(args, wall_seconds):
+    """ Print (--profile) and/or save (--profile_json) the profiler-counters.
+
+    With worker-processes the times of the stages are summed over the
+    processes, so they can add up to more than the wall-time.
+    """
+    if args.profile:
+        print(profiler.format_table(wall_seconds))
+    if args.profile_json:
+        with open(args.profile_json, "w") as profile_file:
+            json.dump(profiler.report(wall_seconds), profile_file, indent=2)
+        logger.info(f"Profile was saved to {args.profile_json}.")
+
+
+def log_to_stderr():
+    """ Keep stdout free for a stream: logging, print and pprint go to stderr. """
+    loggers = [logging.getLogger()] + list(logging.root.manager.loggerDict.values())
+    for logger_object in loggers:
+        for log_handler in getattr(logger_object, "handlers", []):
+            if isinstance(log_handler, logging.StreamHandler) and log_handler.stream is sys.stdout:
+                log_handler.setStream(sys.stderr)
+    sys.stdout = sys.stderr
+
+
+def stream_raw(args, tvptree, clip, layers):
+    """ Write the raw RGBA-bytes of the frames, one after another, to stdout or
+    to a file/FIFO (--stream_output).
+
+    With --composite the composites are streamed, otherwise the frames of the
+    layers (layer after layer). Every frame is width * height * 4 bytes (the
+    size of the clip, at 1/--scale) in RGBA-order (also for TVPaint 9, which stores ABGR). The size and
+    amount of frames are written to stderr as 'width=.. height=.. pix_fmt=rgba
+    frames=..'.
+
+    Args:
+        args (argparse.Namespace): the commandline-arguments
+        tvptree (TvpProject): the project
+        clip (Clip): the clip to stream
+        layers (list): the Layer-objects to stream, without --composite
+    """
+    if args.frame is not None:
+        frames = range(args.frame, args.frame + 1)
+    else:
+        frames = range(max([l.settings['end_frame'] for l in clip.layers]) + 1)
+
+    width, height = scaled_size(clip.width, args.scale), scaled_size(clip.height, args.scale)
+    if args.composite:
+        num_frames = len(frames)
+        images = (clip.composite_frame(i, args.scale) for i in frames)
+    else:
+        num_frames = len(frames) * len(layers)
+        images = (
+            image
+            for layer in layers
+            for _i, image in layer.iter_frames(frames.start, frames.stop, args.scale)
+        )
+    sys.stderr.write(
+        f"width={width} height={height} pix_fmt=rgba frames={num_frames}\n"
+    )
+    sys.stderr.flush()
+
+    if args.stream_output == "-":
+        stream = sys.__stdout__.buffer
+    else:
+        stream = open(args.stream_output, "wb")  # blocks till a FIFO has a reader
+
+    # TVPaint 9 stores ABGR, the channels are reversed into one reused buffer,
+    # other frames are written straight from their buffer.
+    swapped = None
+    if tvptree.tvpaint_version[0] == 9:
+        swapped = np.empty(shape=(height, width, 4), dtype=np.uint8)
+    try:
+        for image in images:
+            if swapped is not None:
+                with profiler.measure("color_convert", image.nbytes) as measurement:
+                    np.copyto(swapped, image[:, :, ::-1])
+                    measurement.bytes_out = swapped.nbytes
+                image = swapped
+            with profiler.measure("stream_write", image.nbytes):
+                stream.write(memoryview(np.ascontiguousarray(image)).cast("B"))
+        stream.flush()
+    except BrokenPipeError:
+        logger.warning("The reader of the stream has stopped.")
+        # don't fail again on flushing stdout at exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, stream.fileno())
+    finally:
+        if stream is not sys.__stdout__.buffer:
+            stream.close()
+
+
+def save_npy(tvpp, images, num_frames, height, width, file_path):
+    """ Write frames into one (num_frames, height, width, 4) uint8 .npy-file.
+
+    The file is created with open_memmap and every frame is copied straight
+    into its slot of the mapping, so only one frame is in memory at a time.
+    The channels are RGBA, also for TVPaint 9 (which stores ABGR).
+
+    Args:
+        tvpp (TvpProject): the project
+        images (iterable): the frames, (height, width, 4)-arrays
+        num_frames (int): amount of frames
+        height (int): height of the frames
+        width (int): width of the frames
+        file_path (str): path of the .npy-file (overwrites!)
+    """
+    logger.info(f"Saving {num_frames} frames to {file_path}.")
+    array = np.lib.format.open_memmap(
+        file_path, mode="w+", dtype=np.uint8, shape=(num_frames, height, width, 4)
+    )
+    reverse_channels = tvpp.tvpaint_version[0] == 9
+    for slot, image in zip(array, images):
+        with profiler.measure("npy_write", image.nbytes) as measurement:
+            if reverse_channels:
+                np.copyto(slot, image[:, :, ::-1])
+            else:
+                np.copyto(slot, image)
+            measurement.bytes_out = slot.nbytes
+    array.flush()
+    del array
+
+
+def export_npy(args, tvptree, clip, layers, output_dir):
+    """ Export the frames of every layer to <layer>.npy, or with --composite
+    the composites to composite.npy (see save_npy).
+
+    Index 0 of the arrays is the first exported timeline-position (--frame,
+    or 0).
+
+    Args:
+        args (argparse.Namespace): the commandline-arguments
+        tvptree (TvpProject): the project
+        clip (Clip): the clip
+        layers (list): the Layer-objects to export, without --composite
+        output_dir (str): directory to save to
+    """
+    if not os.path.exists(output_dir):
+        raise FileNotFoundError(f"'{output_dir}' does not exist")
+    if args.frame is not None:
+        frames = range(args.frame, args.frame + 1)
+    else:
+        frames = range(max([l.settings['end_frame'] for l in clip.layers], default=-1) + 1)
+    width, height = scaled_size(clip.width, args.scale), scaled_size(clip.height, args.scale)
+
+    if args.composite:
+        save_npy(
+            tvptree, (clip.composite_frame(i, args.scale) for i in frames), len(frames),
+            height, width, os.path.join(output_dir, "composite.npy")
+        )
+        return
+    for layer in layers:
+        save_npy(
+            tvptree,
+            (image for _i, image in layer.iter_frames(frames.start, frames.stop, args.scale)),
+            len(frames), height, width,
+            os.path.join(output_dir, f"{layer.index:03d}.npy")
+        )
+
+
+def write_bytes(data, output_dir, file_name):
+    """ Save data as it is, to output_dir/file_name. """
+    file_path = os.path.join(output_dir, file_name)
+    logger.info(f"Saving to {file_path}.")
+    with open(file_path, "wb") as data_file:
+        data_file.write(data)
+
+
+def export_thumbnails(args, tvptree):
+    """ Save the thumbnail of the project (thumbnail.png), and with -a or -l
+    the thumbnails that are stored with the images of the layers
+    (###_####_thumb.png). No imagedata is decoded.
+
+    The format of the thumbnails is not documented, they are decoded
+    best-effort with the size of the thumbnail-info of the project; the ones
+    that do not fit are skipped with a warning. With --thumbnail_raw the
+    thumbnails are saved as they are stored (.bin instead of .png), with the
+    thumbnail-info (thumbnail.json).
+
+    Args:
+        args (argparse.Namespace): the commandline-arguments
+        tvptree (TvpProject): the project
+    """
+    output_dir = args.output_dir
+    if not os.path.exists(output_dir):
+        raise FileNotFoundError(f"'{output_dir}' does not exist")
+    data, info = tvptree.read_thumbnail_data()
+    size = tvptree.thumbnail_size()
+    if args.thumbnail_raw:
+        file_path = os.path.join(output_dir, "thumbnail.json")
+        logger.info(f"Saving thumbnail-info to {file_path}.")
+        with open(file_path, "w") as info_file:
+            json.dump(info, info_file, indent=2)
+        if data is not None:
+            write_bytes(data, output_dir, "thumbnail.bin")
+    elif data is None:
+        logger.warning("The project has no thumbnail.")
+    else:
+        try:
+            thumbnail = tvptree.read_thumbnail()
+        except ValueError as error:
+            logger.warning(f"The project-thumbnail is not saved: {error}")
+        else:
+            write_img(tvptree, thumbnail, output_dir, "thumbnail.png", args.png_compression)
+
+    if not args.all_layers and args.layer is None:
+        return  # the clip is not scanned when only the project-thumbnail is needed
+    if size is None and not args.thumbnail_raw:
+        logger.warning(
+            f"The thumbnails of the images are not saved, their size is unknown "
+            f"(thumbnail-info: {info}), use --thumbnail_raw to save their data."
+        )
+        return
+    clip = Clip(tvptree, scene_index=args.scene, clip_index=args.clip)
+    layers = clip.layers if args.layer is None else [clip.layers[args.layer]]
+    for layer in layers:
+        if args.frame is not None:
+            frames = range(args.frame, args.frame + 1)
+        else:
+            frames = range(layer.settings["start_frame"], layer.settings["end_frame"] + 1)
+        for i in frames:
+            file_name = f"{layer.index:03d}_{i:04d}_thumb"
+            if args.thumbnail_raw:
+                thumbnail_data = layer.thumbnail_data(i)
+                if thumbnail_data:
+                    write_bytes(thumbnail_data, output_dir, file_name + ".bin")
+                continue
+            try:
+                thumbnail = layer.thumbnail(i, size)
+            except ValueError as error:
+                logger.warning(f"Layer {layer.index}, Frame {i}: the thumbnail is not saved: {error}")
+                continue
+            if thumbnail is None:
+                logger.debug(f"Layer {layer.index}, Frame {i} has no thumbnail.")
+                continue
+            write_img(tvptree, thumbnail, output_dir, file_name + ".png", args.png_compression)
+
+
+def image_writer(args):
+    """ Return an ImageWriter, from the --writers & --png_compression-args. """
+    return ImageWriter(args.writers, compression=args.png_compression)
+
+
+def cache_size(args):
+    """ Return the cache-size in bytes, from the --cache_size-arg (MB). """
+    if args.cache_size is None:
+        return None
+    return args.cache_size * 1024 * 1024
+
+
+def max_memory(args):
+    """ Return the memory-limit in bytes, from the --max_memory-arg (MB). """
+    if args.max_memory is None:
+        return None
+    return args.max_memory * 1024 * 1024
 
 
 def main():
@@ -102,6 +717,24 @@ def main():
         action="store_true",
         help="Slideshow-mode: press key for next frame(ESC to quit)"
     )
+    parser.add_argument(
+        "--scene",
+        type=int,
+        default=0,
+        help="index of the scene (default: 0)"
+    )
+    parser.add_argument(
+        "--clip",
+        type=int,
+        default=0,
+        help="index of the clip in the scene (default: 0)"
+    )
+    parser.add_argument(
+        "--all_clips",
+        action="store_true",
+        help="Export all clips of all scenes, each to <output_dir>/scene##_clip##. "
+             "With --jobs the clips are exported in parallel."
+    )
     parser.add_argument('-o',
         "--output_dir",
         type=str,
@@ -112,26 +745,223 @@ def main():
         action="store_true",
         help="Print info of everything (project, clip, scene, layer)"
     )
+    parser.add_argument('-c',
+        "--composite",
+        action="store_true",
+        help="Blend the visible layers into one image per frame (composite_####.png)."
+    )
     parser.add_argument('-t',
         "--test",
         action="store_true",
         help="Test all processing, use this without the --show option for quicker testing."
     )
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="Memory-map the project-file instead of reading it in pieces."
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=["hardlink", "symlink", "manifest"],
+        help="Save repeated frames (holds) once: as links to the first frame, or only "
+             "the unique frames with a timing-manifest(json)."
+    )
+    parser.add_argument('-j',
+        "--jobs",
+        type=int,
+        default=1,
+        help="Amount of processes to export with (only when saving images, without --show)."
+    )
+    parser.add_argument(
+        "--writers",
+        type=int,
+        default=2,
+        help="Amount of threads that encode&write the images while the next frames are decoded "
+             "(0 writes in between the decoding)."
+    )
+    parser.add_argument(
+        "--png_compression",
+        type=int,
+        choices=range(10),
+        metavar="[0-9]",
+        help="PNG compression-level, 0 is fastest (biggest files), 9 is smallest (default: opencv's default)."
+    )
+    parser.add_argument(
+        "--scale",
+        type=int,
+        choices=SCALES,
+        default=1,
+        help="Export proxies at 1/scale of the resolution, the tiles are subsampled while the "
+             "frames are assembled (default: 1, full resolution)."
+    )
+    parser.add_argument(
+        "--zchk_workers",
+        type=int,
+        help="Amount of threads to decompress the blocks of zipped imagedata with."
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        help="Memory-budget (MB) for decoded tiles&images, omitting this keeps everything."
+    )
+    parser.add_argument(
+        "--max_memory",
+        type=int,
+        help="Memory-limit (MB, per process) for the read&unzipped imagedata (a quarter) and the "
+             "decoded tiles&images (the rest), the least recently used data is dropped and read "
+             "again when needed (replaces --cache_size). The image that is being built comes on top."
+    )
+
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Keep an index of the project-structure next to the file (<file>.index.json), "
+             "reopening an unchanged file skips scanning it."
+    )
+    parser.add_argument(
+        "--index_dir",
+        type=str,
+        help="Directory to keep the index in (implies --index)."
+    )
+
+    parser.add_argument(
+        "--thumbnail",
+        action="store_true",
+        help="Only save the thumbnails that are stored in the project, without decoding any "
+             "imagedata: <output_dir>/thumbnail.png, with -a or -l also the thumbnails of the "
+             "images (###_####_thumb.png). The format of the thumbnails is not documented, "
+             "they are decoded best-effort with the size of the project-thumbnail."
+    )
+    parser.add_argument(
+        "--thumbnail_raw",
+        action="store_true",
+        help="Like --thumbnail, but save the thumbnails as they are stored, not decoded "
+             "(thumbnail.bin, ###_####_thumb.bin), with the thumbnail-info (thumbnail.json)."
+    )
+    parser.add_argument(
+        "--npy",
+        action="store_true",
+        help="Save all frames of a layer in one (frames, height, width, 4) RGBA-array: "
+             "<output_dir>/###.npy (with -c composite.npy), instead of png-images."
+    )
+    parser.add_argument(
+        "--stream",
+        choices=["raw"],
+        help="Write the frames (with -c the composites) as raw RGBA-bytes to stdout, "
+             "instead of saving images. The size&amount of frames are written to stderr."
+    )
+    parser.add_argument(
+        "--stream_output",
+        type=str,
+        default="-",
+        help="File or FIFO to stream to (default: '-' is stdout)."
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a table of the time and bytes per stage (scan, I/O, inflate, RLE-decode, ...)."
+    )
+    parser.add_argument(
+        "--profile_json",
+        type=str,
+        help="Save the time and bytes per stage to this json-file."
+    )
 
     args = parser.parse_args()
+    if args.stream and args.stream_output == "-":
+        log_to_stderr()
+    profiler.enabled = args.profile or args.profile_json is not None
+    start_time = time.perf_counter()
+    try:
+        run(args, parser)
+    finally:
+        if profiler.enabled:
+            save_profile(args, time.perf_counter() - start_time)
+
+
+def run(args, parser):
+    """ Export/show/print, what the commandline-arguments ask for.
+
+    Args:
+        args (argparse.Namespace): the commandline-arguments
+        parser (argparse.ArgumentParser): the parser of the arguments
+    """
     if args.debug:
         root_logger = logging.getLogger()
         root_logger.setLevel(logging.DEBUG)
 
-    tvptree = TvpProject(args.tvpp)
-    scene = tvptree.get_scene_tree(scene_index=0)
-    clip = Clip(tvptree, scene_index=0, clip_index=0)
+    tvptree = TvpProject(
+        args.tvpp, use_mmap=args.mmap, use_index=args.index, index_dir=args.index_dir
+    )
+    if args.all_clips:
+        if not args.output_dir:
+            parser.error("--all_clips needs an --output_dir")
+        export_all_clips(args, tvptree)
+        return
+
+    if args.thumbnail or args.thumbnail_raw:
+        if not args.output_dir:
+            parser.error("--thumbnail needs an --output_dir")
+        export_thumbnails(args, tvptree)
+        return
+
+    scene = tvptree.get_scene_tree(scene_index=args.scene)
+    clip = Clip(
+        tvptree, scene_index=args.scene, clip_index=args.clip,
+        zchk_workers=args.zchk_workers, cache_size=cache_size(args),
+        max_memory=max_memory(args)
+    )
 
     if args.print_info:
         pprint(tvptree.metadata)
         pprint(tvptree.read_scene_metadata(scene))
         pprint(clip.metadata)
 
+    if args.stream:
+        layers = []
+        if args.all_layers:
+            layers = clip.layers
+        if args.layer is not None:
+            layers = [clip.layers[args.layer]]
+        if not layers and not args.composite:
+            parser.error("--stream needs the layers to stream (-a, -l) or --composite")
+        stream_raw(args, tvptree, clip, layers)
+        return
+
+    if args.npy:
+        if not args.output_dir:
+            parser.error("--npy needs an --output_dir")
+        layers = []
+        if args.all_layers:
+            layers = clip.layers
+        if args.layer is not None:
+            layers = [clip.layers[args.layer]]
+        if not layers and not args.composite:
+            parser.error("--npy needs the layers to export (-a, -l) or --composite")
+        export_npy(args, tvptree, clip, layers, args.output_dir)
+        return
+
+    if args.composite:
+        if args.frame is not None:
+            frames = [args.frame]
+        else:
+            frames = range(max([l.settings['end_frame'] for l in clip.layers]) + 1)
+        with image_writer(args) as writer:
+            for i in frames:
+                start_time = time.time()
+                image = clip.composite_frame(i, args.scale)
+                logger.info(
+                    f"Composite, Frame {i}, processing took: {time.time() - start_time:.6f} seconds"
+                )
+                if args.show:
+                    if args.interactive:
+                        show_window(tvptree, clip.bgp1, image)
+                    else:
+                        show_window(tvptree, clip.bgp1, image, timeout=10)
+                if args.output_dir:
+                    save_composite(tvptree, image, i, args.output_dir, writer)
+        return
+
     layers = []
     if args.all_layers:
         layers = clip.layers
@@ -139,45 +969,62 @@ def main():
     if args.layer is not None:
         layers = [clip.layers[args.layer]]
 
-    for layer in layers:
+    if args.jobs > 1 and args.output_dir and not args.show and layers:
         if args.print_info:
-            pprint(layer.settings)
-
-        if not args.test:
-            if not args.output_dir and not args.show:
-                sys.exit(0)
+            for layer in layers:
+                pprint(layer.settings)
+        export_parallel(args, clip, layers, scene_index=args.scene, clip_index=args.clip)
+        return
 
-        if args.frame is not None:
-            start_time = time.time()
-            image = layer.frame(args.frame)
-            logger.info(
-                f"Layer {layer.index} (\"{layer.name}\"), Frame {args.frame}, "
-                f"processing took: {time.time() - start_time:.6f} seconds"
-            )
+    with image_writer(args) as writer:
+        for layer in layers:
+            if args.print_info:
+                pprint(layer.settings)
 
-            if args.show:
-                if args.interactive:
-                    show_window(tvptree, clip.bgp1, image)
-                else:
-                    show_window(tvptree, clip.bgp1, image, timeout=10)
+            if not args.test:
+                if not args.output_dir and not args.show:
+                    sys.exit(0)
 
-            if args.output_dir:
-                save_img(tvptree, layer, image, args.frame, args.output_dir)
-        else:
-            end_frame = max([l.settings['end_frame'] for l in clip.layers])
-            for i in range(end_frame + 1):
+            if args.frame is not None:
                 start_time = time.time()
-                image = layer.frame(i)
+                image = layer.frame(args.frame, args.scale)
                 logger.info(
-                    f"Layer {layer.index} (\"{layer.name}\") Frame {i}, processing took: {time.time() - start_time:.6f} seconds"
+                    f"Layer {layer.index} (\"{layer.name}\"), Frame {args.frame}, "
+                    f"processing took: {time.time() - start_time:.6f} seconds"
                 )
+
                 if args.show:
                     if args.interactive:
                         show_window(tvptree, clip.bgp1, image)
                     else:
                         show_window(tvptree, clip.bgp1, image, timeout=10)
+
                 if args.output_dir:
-                    save_img(tvptree, layer, image, i, args.output_dir)
+                    save_img(tvptree, layer, image, args.frame, args.output_dir, writer)
+            else:
+                end_frame = max([l.settings['end_frame'] for l in clip.layers])
+                repeats = None
+                if args.dedup and args.output_dir:
+                    repeats = layer.find_repeats(0, end_frame + 1)
+                start_time = time.time()
+                for i, image in layer.iter_frames(0, end_frame + 1, args.scale):
+                    logger.info(
+                        f"Layer {layer.index} (\"{layer.name}\") Frame {i}, processing took: {time.time() - start_time:.6f} seconds"
+                    )
+                    if args.show:
+                        if args.interactive:
+                            show_window(tvptree, clip.bgp1, image)
+                        else:
+                            show_window(tvptree, clip.bgp1, image, timeout=10)
+                    if args.output_dir and (repeats is None or repeats[i] == i):
+                        save_img(tvptree, layer, image, i, args.output_dir, writer)
+                    start_time = time.time()
+                if repeats is not None:
+                    writer.flush()  # links need the files of the first frames
+                    save_repeats(layer, repeats, args.output_dir, args.dedup)
+
+    if clip.cache is not None:
+        logger.debug(f"Cache: {clip.cache.stats}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+"""A least-recently-used cache for decoded data (tiles, images).
+
+Issued under the "do what you like with it - I take no responsibility" licence
+"""
+
+import sys
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+class LRUCache(object):
+    """ A cache with a budget in bytes, the least recently used items are
+    dropped first when the budget is exceeded.
+
+    The size of an item is its 'nbytes' (numpy-arrays) or its length
+    (bytes, bytearray). The item that was put last is never dropped, so a
+    single item that is bigger than the budget is still cached (alone).
+    Items are looked up by key, the objects that own the data (Image,
+    ImageTile) are used as key.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def item_size(value):
+        """ Return the size of an item in bytes. """
+        num_bytes = getattr(value, "nbytes", None)
+        if num_bytes is None:
+            num_bytes = len(value)
+        return num_bytes
+
+    def get(self, key, default=None):
+        """ Return the cached item, and mark it as most recently used.
+
+        Args:
+            key: key of the item
+            default: returned when the item is not in the cache
+
+        Returns:
+            the item, or 'default'
+        """
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """ Store an item, and drop least recently used items when the cache
+        gets over budget.
+
+        Args:
+            key: key of the item
+            value: the item (np.ndarray, bytes, bytearray)
+        """
+        self.discard(key)
+        self._items[key] = value
+        self.num_bytes += self.item_size(value)
+        while self.num_bytes > self.max_bytes and len(self._items) > 1:
+            _key, evicted = self._items.popitem(last=False)
+            self.num_bytes -= self.item_size(evicted)
+            self.evictions += 1
+
+    def discard(self, key):
+        """ Remove an item, if it is in the cache. """
+        value = self._items.pop(key, None)
+        if value is not None:
+            self.num_bytes -= self.item_size(value)
+
+    def clear(self):
+        """ Remove all items. """
+        self._items.clear()
+        self.num_bytes = 0
+
+    @property
+    def stats(self):
+        """ Return the counters of the cache.
+
+        Returns:
+            dict: hits, misses, evictions, amount of items & bytes
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "items": len(self._items),
+            "bytes": self.num_bytes,
+            "max_bytes": self.max_bytes,
+        }
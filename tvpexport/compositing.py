@@ -0,0 +1,84 @@
+""" Blending of layers.
+
+The blend-functions work in-place on premultiplied float32-arrays:
+the colors (height, width, 3) and alpha (height, width, 1) of the
+destination (the layers below) are updated with those of the source layer.
+The color-channels can be in any order (RGB or BGR), they are blended
+separately.
+
+Issued under the "do what you like with it - I take no responsibility" licence
+"""
+
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# The layer-opacity ('transperency' of LRHD) is assumed to be 0-255.
+LAYER_OPACITY_MAX = 255
+
+
+def blend_normal(dst_color, dst_alpha, src_color, src_alpha):
+    """ Blend-mode 'color' (normal): the source over the destination.
+
+    Args:
+        dst_color (np.ndarray): premultiplied colors of the destination
+        dst_alpha (np.ndarray): alpha of the destination
+        src_color (np.ndarray): premultiplied colors of the source
+        src_alpha (np.ndarray): alpha of the source
+    """
+    inverse_alpha = 1.0 - src_alpha
+    dst_color *= inverse_alpha
+    dst_color += src_color
+    dst_alpha *= inverse_alpha
+    dst_alpha += src_alpha
+
+
+def blend_multiply(dst_color, dst_alpha, src_color, src_alpha):
+    """ Blend-mode 'multiply'.
+
+    Premultiplied: color = src * dst + src * (1 - dst_alpha) + dst * (1 - src_alpha)
+
+    Args:
+        dst_color (np.ndarray): premultiplied colors of the destination
+        dst_alpha (np.ndarray): alpha of the destination
+        src_color (np.ndarray): premultiplied colors of the source
+        src_alpha (np.ndarray): alpha of the source
+    """
+    inverse_alpha = 1.0 - src_alpha
+    src_part = src_color * (1.0 - dst_alpha)
+    dst_color *= src_color + inverse_alpha
+    dst_color += src_part
+    dst_alpha *= inverse_alpha
+    dst_alpha += src_alpha
+
+
+# blend_mode (LRHD): blend-function
+BLEND_MODES = {
+    0: blend_normal,
+    9: blend_multiply,
+}
+_warned_blend_modes = set()
+
+
+def get_blend_function(blend_mode):
+    """ Return the blend-function of a blend-mode.
+
+    Unknown blend-modes are blended as 'color' (normal).
+
+    Args:
+        blend_mode (int): blend_mode of the layer-settings
+
+    Returns:
+        function
+    """
+    if blend_mode not in BLEND_MODES:
+        if blend_mode not in _warned_blend_modes:
+            _warned_blend_modes.add(blend_mode)
+            logger.warning(f"Blend-mode {blend_mode} is not supported, using 'color'.")
+        return blend_normal
+    return BLEND_MODES[blend_mode]
@@ -8,6 +8,10 @@ import struct
 import numpy as np
 # import cv2
 from . import decoders
+from . import compositing
+from .cache import LRUCache
+from .parser import HeaderReader
+from .profiling import profiler
 import logging
 
 # setup logger
@@ -17,6 +21,38 @@ formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
+unpack_chunk_header = struct.Struct(">4sI").unpack_from
+
+IMAGE_CHUNKS = frozenset(("ZCHK", "DBOD", "SRAW"))
+# part of 'max_memory' (see Clip) for the chunk-data, the rest is for the
+# decoded tiles&images
+MAX_MEMORY_DATA_SHARE = 0.25
+# chunk-ident: (attribute of the Clip, decoder)
+CLIP_CHUNK_DECODERS = {
+    "DGBL": ("dgbl", decoders.decode_DGBL),
+    "DPEL": ("dpel", decoders.decode_DPEL),
+    "BGMD": ("bgmd", decoders.decode_BGMD),
+    "DLOC": ("dloc", decoders.decode_DLOC),
+    "ARAT": ("arat", decoders.decode_ARAT),
+    "CRLR": ("crlr", decoders.decode_CRLR),
+    "BGP1": ("bgp1", decoders.decode_BGP1),
+    "BGP2": ("bgp2", decoders.decode_BGP2),
+    "ANNO": ("anno", decoders.decode_ANNO),
+    "FRAT": ("frat", decoders.decode_FRAT),
+    "FILD": ("fild", decoders.decode_FILD),
+    "MARK": ("mark", decoders.decode_MARK),
+    "XSHT": ("xsht", decoders.decode_XSHT),
+    "TLNT": ("tlnt", decoders.decode_TLNT),
+}
+# chunk-ident: method of the Clip that handles the layer-data
+LAYER_CHUNK_HANDLERS = {
+    "LNAM": "_add_layer",
+    "LRHD": "_set_layer_settings",
+    "LRSH": "_set_layer_settings",  # has a ctg-layer
+    "LRSR": "_add_ctg_layer",
+    "LEXT": "_set_layer_lext",
+}
+
 
 class Clip(object):
     """Clip-object.
@@ -61,8 +97,28 @@ class Clip(object):
         FCFG
     """
 
-    def __init__(self, tvptree, scene_index=0, clip_index=0):
+    def __init__(
+        self, tvptree, scene_index=0, clip_index=0, zchk_workers=None, cache_size=None,
+        max_memory=None
+    ):
         self.tvptree = tvptree
+        self.zchk_workers = zchk_workers  # threads per ZCHK-decompression
+        # Decoded tiles & images of all layers go through this cache, without a
+        # cache-size every image keeps its data. With 'max_memory' the
+        # chunk-data of the images (read, and unzipped) goes through a
+        # data-cache, max_memory is split over the two (MAX_MEMORY_DATA_SHARE
+        # for the data), so decoding never drops the data it decodes from.
+        # The image that is being built, and the data of its sources, are
+        # held outside of the caches till it is complete (see Image.pin).
+        self.cache = None
+        self.data_cache = None
+        self.max_memory = max_memory
+        if max_memory is not None:
+            data_budget = int(max_memory * MAX_MEMORY_DATA_SHARE)
+            self.cache = LRUCache(max_memory - data_budget)
+            self.data_cache = LRUCache(data_budget)
+        elif cache_size is not None:
+            self.cache = LRUCache(cache_size)
         self.layers = []
         self.width = 0
         self.height = 0
@@ -70,13 +126,14 @@ class Clip(object):
         self.arat = ()
         self.bgp1 = ()
         self.bgp2 = ()
+        self.scene_index = scene_index
+        self.clip_index = clip_index
         clip_tree = tvptree.get_clip_tree(
             scene_index=scene_index, clip_index=clip_index
         )
-        self.metadata = self._read_clip_metadata(tvptree.file_path, clip_tree)
+        self.metadata = self._read_clip_metadata(clip_tree)
         try:
-            with open(self.tvptree.file_path, "rb") as file_obj:
-                self.read_clip_data(file_obj, clip_tree)
+            self.read_clip_data(self.tvptree.file_obj, clip_tree)
         except Exception as _exception_:
             logger.exception(
                 f"This file might be corrupt! \n"
@@ -102,115 +159,235 @@ class Clip(object):
         self._dloc = values
         return self._dloc
 
-    def _read_clip_metadata(self, file_path, clip_tree):
+    def composite_frame(self, index, scale=1):
+        """ Return the composite of the visible layers at a timeline-position.
+
+        The layers are blended from bottom to top, with the blend_mode,
+        transperency and invisible-setting of the layers (CTG-layers are
+        skipped). The blending is done in place on premultiplied float-buffers
+        (see compositing).
+
+        Args:
+            index (int): timeline-position (starts with 0)
+            scale (int): blend proxies of the layers, see Layer.frame
+
+        Returns:
+            numpy.ndarray(): image-data, with the same channel-order as the
+                images of the layers.
+        """
+        if self.tvptree.tvpaint_version[0] == 9:  # ABGR
+            alpha_channel, color_channels = 0, slice(1, 4)
+        else:  # RGBA
+            alpha_channel, color_channels = 3, slice(0, 3)
+
+        height, width = scaled_size(self.height, scale), scaled_size(self.width, scale)
+        color = np.zeros(shape=(height, width, 3), dtype=np.float32)
+        alpha = np.zeros(shape=(height, width, 1), dtype=np.float32)
+        for layer in reversed(self.layers):
+            if layer.is_ctg or layer.settings.get("invisible"):
+                continue
+            if layer.image_index(index) is None:
+                continue
+            opacity = min(
+                layer.settings.get("transperency", compositing.LAYER_OPACITY_MAX),
+                compositing.LAYER_OPACITY_MAX
+            ) / compositing.LAYER_OPACITY_MAX
+            if opacity <= 0:
+                continue
+
+            # only blend the region of the tiles that are not empty
+            region = layer.painted_region(index, scale)
+            if region is None:
+                continue
+
+            image = layer.frame(index, scale)[region]
+            with profiler.measure("composite", image.nbytes):
+                src_alpha = image[:, :, alpha_channel : alpha_channel + 1].astype(np.float32)
+                src_alpha *= opacity / 255
+                src_color = image[:, :, color_channels].astype(np.float32)
+                src_color *= 1 / 255
+                src_color *= src_alpha
+                blend = compositing.get_blend_function(layer.settings.get("blend_mode", 0))
+                blend(color[region], alpha[region], src_color, src_alpha)
+
+        # back to straight alpha & 8 bits
+        with profiler.measure("color_convert", color.nbytes + alpha.nbytes) as measurement:
+            np.divide(color, alpha, out=color, where=alpha > 0)
+            result = np.zeros(shape=(height, width, 4), dtype=np.uint8)
+            color *= 255
+            color += 0.5
+            np.clip(color, 0, 255, out=color)
+            result[:, :, color_channels] = color
+            alpha *= 255
+            alpha += 0.5
+            result[:, :, alpha_channel] = alpha[:, :, 0]
+            measurement.bytes_out = result.nbytes
+        return result
+
+    def _read_clip_metadata(self, clip_tree):
         """ Read and parse the clip-metadata.
         Args:
-            file_path (_type_): _description_
-            clip_tree (_type_): _description_
+            clip_tree (Node): clip-node
 
         Returns:
-            _type_: _description_
+            dict: clip-info
         """
-        with open(file_path, "rb") as file_obj:
-            d_offset = clip_tree.children[0].data_offset
-            size = clip_tree.children[0].size
-            file_obj.seek(d_offset, 0)
-            data = file_obj.read(size)
+        clip_info = clip_tree.children[0]
+        data = self.tvptree.read_data(clip_info.data_offset, clip_info.size)
         return decoders.parse_utf16_dictdata(data)
 
     def read_clip_data(self, file_obj, clip_tree):
-        """_summary_
+        """ Read the clip-data: the clip-settings, the layers and their images.
+
+        The positions of the chunks are taken from the sidecar-index of the
+        project when it has them, otherwise the clip-data is scanned.
+
+        Args:
+            file_obj (_io.BufferedReader): the project-file
+            clip_tree (Node): clip-node
+        """
+        chunks = self.tvptree.get_clip_chunks(self.scene_index, self.clip_index)
+        if chunks is None:
+            with profiler.measure("scan"):
+                chunks = self._scan_clip_chunks(clip_tree)
+            self.tvptree.set_clip_chunks(self.scene_index, self.clip_index, chunks)
+        else:
+            logger.debug("Chunk-positions of the clip were read from the index.")
+
+        for ident, data_offset, size in chunks:
+            if ident in IMAGE_CHUNKS:
+                # Imagedata is only indexed here, the bytes are read when the
+                # image is accessed. (see Image.raw_data)
+                layer = self.layers[-1]
+                image = Image(ident, len(layer.images), self.width, self.height)
+                image.tvptree = self.tvptree
+                image.zchk_workers = self.zchk_workers
+                image.cache = self.cache
+                image.data_cache = self.data_cache
+                image.data_offset = data_offset
+                image.data_size = size
+                layer.images.append(image)
+                continue
+
+            clip_decoder = CLIP_CHUNK_DECODERS.get(ident)
+            layer_handler = LAYER_CHUNK_HANDLERS.get(ident)
+            if clip_decoder is None and layer_handler is None:
+                continue  # not (yet) supported
+
+            # these chunks are small, a copy keeps memoryviews of the file out
+            # of the decoded settings
+            data = bytes(self.tvptree.read_data(data_offset, size))
+            if clip_decoder is not None:
+                attribute, decode = clip_decoder
+                setattr(self, attribute, decode(data))
+            else:
+                getattr(self, layer_handler)(data)
+
+    def _add_layer(self, data):
+        """ LNAM is the first chunk of a layer. """
+        layer_name = decoders.decode_LNAM(data)
+        new_layer = Layer(len(self.layers), layer_name, self.width, self.height)
+        new_layer.cache = self.cache
+        self.layers.append(new_layer)
+
+    def _add_ctg_layer(self, _data):
+        """ LRSR: it's a ctg-layer for the layer above. """
+        above = self.layers[-1]
+        new_layer = Layer(len(self.layers), above.name, self.width, self.height)
+        new_layer.settings = above.settings
+        new_layer.cache = self.cache
+        new_layer.is_ctg = True
+        self.layers.append(new_layer)
+
+    def _set_layer_settings(self, data):
+        """ LRHD, or LRSH when the layer has a ctg-layer. """
+        self.layers[-1].settings = decoders.decode_LRHD(data)
+
+    def _set_layer_lext(self, data):
+        self.layers[-1].lext = decoders.decode_LEXT(data)
+
+    def _scan_clip_chunks(self, clip_tree):
+        """ Walk the IFF-chunks of the clip-data.
 
         Args:
-            file_obj (_type_): _description_
-            clip_tree (_type_): _description_
+            clip_tree (Node): clip-node
+
+        Returns:
+            list: [ident, data_offset, size]-items, in file-order
         """
         d_offset = clip_tree.children[1].data_offset
-        size = clip_tree.children[1].size
-        file_obj.seek(d_offset, 0)
+        read_data = HeaderReader(self.tvptree).read
 
-        header_bytes = file_obj.read(12)
+        header_bytes = read_data(d_offset, 12)
         offset = 12
         form_name = bytes(struct.unpack_from("BBBB", header_bytes, 0)).decode("ascii")
         form_size = struct.unpack_from(">I", header_bytes, 4)[0]
         tvpp_name = bytes(struct.unpack_from("BBBB", header_bytes, 8)).decode("ascii")
         logger.debug(f"{form_name}, {form_size} {tvpp_name}")
 
-
-        layer_index = -1
+        # the chunk-headers are read in blocks, the data of the chunks is skipped
+        chunks = []
         while offset < form_size:
-            header_bytes = file_obj.read(8)
-
-            ident = bytes(struct.unpack_from("BBBB", header_bytes, 0)).decode("ascii")
-            size = struct.unpack_from(">I", header_bytes, 4)[0]
+            ident, size = unpack_chunk_header(read_data(d_offset + offset, 8))
+            ident = ident.decode("ascii")
             offset += 8
 
             if size % 2:
                 size += 1  # size has to be an even number!
 
-            data = file_obj.read(size)
-            logger.debug(f"{ident} = ({size} bytes), was read at pos: {offset}.")
+            logger.debug(f"{ident} = ({size} bytes), was indexed at pos: {offset}.")
+            chunks.append([ident, d_offset + offset, size])
             offset += size
+        return chunks
+
+
+# proxy-scales: 1/scale of the resolution, tiles have to divide into whole blocks
+SCALES = (1, 2, 4, 8)
+
+
+def scaled_size(size, scale):
+    """ Return the size (width or height) of a proxy, at 1/scale.
+
+    Args:
+        size (int): full size
+        scale (int): one of SCALES
+
+    Returns:
+        int
+    """
+    if scale not in SCALES:
+        raise ValueError(f"Unsupported scale {scale}, use one of {SCALES}")
+    return -(-size // scale)
+
+
+def shift_region(region, origin):
+    """ Return a region (slice-y, slice-x) relative to 'origin' (y, x), None
+    leaves it as it is.
+    """
+    if origin is None:
+        return region
+    region_y, region_x = region
+    return (
+        slice(region_y.start - origin[0], region_y.stop - origin[0]),
+        slice(region_x.start - origin[1], region_x.stop - origin[1])
+    )
 
-            # clip-data:
-            if ident == "DGBL":
-                self.dgbl = decoders.decode_DGBL(data)
-            if ident == "DPEL":
-                self.dpel = decoders.decode_DPEL(data)
-            if ident == "BGMD":
-                self.bgmd = decoders.decode_BGMD(data)
-            if ident == "DLOC":
-                self.dloc = decoders.decode_DLOC(data)
-            if ident == "ARAT":
-                self.arat = decoders.decode_ARAT(data)
-            if ident == "CRLR":
-                self.crlr = decoders.decode_CRLR(data)
-            if ident == "BGP1":
-                self.bgp1 = decoders.decode_BGP1(data)
-            if ident == "BGP2":
-                self.bgp2 = decoders.decode_BGP2(data)
-            if ident == "ANNO":
-                self.anno = decoders.decode_ANNO(data)
-            if ident == "FRAT":
-                self.frat = decoders.decode_FRAT(data)
-            if ident == "FILD":
-                self.fild = decoders.decode_FILD(data)
-            if ident == "MARK":
-                self.mark = decoders.decode_MARK(data)
-            if ident == "XSHT":
-                self.xsht = decoders.decode_XSHT(data)
-            if ident == "TLNT":
-                self.tlnt = decoders.decode_TLNT(data)
-
-            if ident == "LNAM":
-                layer_index += 1  # LNAM is the first item of a layer, so up the index
-                layer_name = decoders.decode_LNAM(data)
-                new_layer = Layer(layer_index, layer_name, self.width, self.height)
-                self.layers.append(new_layer)
-
-            if ident == "LRHD":
-                self.layers[layer_index].settings = decoders.decode_LRHD(data)
-
-            if ident == "LRSH":  # has a ctg-layer
-                self.layers[layer_index].settings = decoders.decode_LRHD(data)
-
-            if ident == "LRSR":  # it's a ctg-layer for layer above
-                layer_index += 1
-                new_layer = Layer(
-                    layer_index, self.layers[layer_index - 1].name, self.width, self.height
-                )
-                new_layer.settings = self.layers[layer_index - 1].settings
-                new_layer.is_ctg = True
-                self.layers.append(new_layer)
 
-            if ident in ("ZCHK", "DBOD", "SRAW"):
-                image_index = len(self.layers[layer_index].images)
-                image = Image(ident, image_index, self.width, self.height)
-                image.raw_data = data
-                self.layers[layer_index].images.append(image)
+def region_in(region, array):
+    """ True when a region (slice-y, slice-x) starts inside of 'array'. """
+    region_y, region_x = region
+    return 0 <= region_y.start < array.shape[0] and 0 <= region_x.start < array.shape[1]
 
-            if ident == "LEXT":
-                self.layers[layer_index].lext = decoders.decode_LEXT(data)
+
+def read_only(array):
+    """ Return a read-only view of an array, the array itself stays writable.
+
+    Constructed images are read-only already, this is for the other arrays
+    that are handed out (empty frames, the buffer of iter_frames).
+    """
+    view = array.view()
+    view.setflags(write=False)
+    return view
 
 
 class Layer(object):
@@ -233,130 +410,622 @@ class Layer(object):
         self.width = width
         self.height = height
         self.settings = {}
+        self.cache = None  # LRUCache (shared by the layers of a clip)
+        self._tile_sources = {}  # image-index: tile-sources (see 'tile_sources')
 
-    def frame(self, index: int):
+    def frame(self, index: int, scale=1, roi=None):
         """ Return a frame/image, given the index of the timeline
 
+        The frame is a read-only view of the constructed image, it is not
+        copied. A constructed image is made read-only (later images only read
+        from it), so it never changes and the view stays valid, also after the image was dropped
+        from the cache. Use frame.copy() to get an image that can be changed.
+
         Args:
             index (int): timeline-position (starts with 0)
+            scale (int): return a proxy at 1/scale of the resolution (see
+                construct_image)
+            roi (tuple): (x, y, width, height), return only this region of the
+                frame (see construct_image)
 
         Returns:
-            numpy.ndarray(): image-data
+            numpy.ndarray(): image-data (read-only)
         """
 
-        start_frame = self.settings["start_frame"]
-        frame_index = index - start_frame
-        if frame_index < 0 or frame_index >= len(self.images):
-            return np.zeros(shape=(self.height, self.width, 4), dtype=np.uint8)
+        frame_index = self.image_index(index)
+        if frame_index is None:
+            result = np.zeros(
+                shape=(scaled_size(self.height, scale), scaled_size(self.width, scale), 4),
+                dtype=np.uint8
+            )
+            if roi is not None:
+                result = result[self._roi_region(roi, scale)]
         else:
-            return self.construct_image(frame_index)
+            result = self.construct_image(frame_index, scale, roi)
+        return read_only(result)
+
+    def _roi_region(self, roi, scale=1):
+        """ Return the region of a frame of a roi: (x, y, width, height),
+        clipped to the frame.
 
-    def construct_image(self, img_index):
+        Args:
+            roi (tuple): (x, y, width, height) in the frame (a proxy at 1/scale)
+            scale (int): scale of the frame
+
+        Returns:
+            tuple: (slice-y, slice-x)
+        """
+        x, y, width, height = roi
+        frame_width, frame_height = scaled_size(self.width, scale), scaled_size(self.height, scale)
+        x_stop, y_stop = min(x + width, frame_width), min(y + height, frame_height)
+        x, y = max(x, 0), max(y, 0)
+        if x >= x_stop or y >= y_stop:
+            raise ValueError(f"Region {roi} is outside of the frame ({frame_width}x{frame_height})")
+        return slice(y, y_stop), slice(x, x_stop)
+
+    def thumbnail_data(self, index: int):
+        """ Return the thumbnail-data that is stored with the image of a
+        frame, as it is stored (not decoded).
+
+        Only the start of the chunk-data of the image is read (and unzipped),
+        no tiles are decoded. Repeated images give the thumbnail of the image
+        they repeat.
+
+        Args:
+            index (int): timeline-position (starts with 0)
+
+        Returns:
+            bytes: thumbnail-data, empty when the layer has no image there, or
+                the image has no thumbnail, like the first image of a layer
+                (DBOD).
+        """
+        frame_index = self.image_index(index)
+        if frame_index is None:
+            return b""
+        image = self.images[frame_index]
+        thumbnail_data = image.thumbnail_data  # this reads the infos too
+        while not thumbnail_data and image.type == "SRAW" and image.first_info in (2, 6):
+            image = self._repeated_image(image)
+            thumbnail_data = image.thumbnail_data
+        return thumbnail_data
+
+    def thumbnail(self, index: int, size):
+        """ Return the thumbnail that is stored with the image of a frame.
+
+        The format of the thumbnails is not documented, it is decoded
+        best-effort with an exact size (see decoders.decode_thumbnail), like
+        the size of the project-thumbnail (TvpProject.thumbnail_size).
+
+        Args:
+            index (int): timeline-position (starts with 0)
+            size (tuple): (width, height) of the thumbnail
+
+        Returns:
+            numpy.ndarray(): thumbnail-image, None when there is no thumbnail
+                (see 'thumbnail_data').
+
+        Raises:
+            ValueError: when the data does not fit the size
+        """
+        return decoders.decode_thumbnail(self.thumbnail_data(index), *size)
+
+    def image_index(self, index: int):
+        """ Return the index of the image at a timeline-position.
+
+        Args:
+            index (int): timeline-position (starts with 0)
+
+        Returns:
+            int: index of the image, None when the layer has no image there
+        """
+        frame_index = index - self.settings["start_frame"]
+        if frame_index < 0 or frame_index >= len(self.images):
+            return None
+        return frame_index
+
+    def construct_image(self, img_index, scale=1, roi=None):
         """ Retreive an image from the imagelist.
 
+        Every tile is copied (or decoded) straight into its slice of the
+        resulting image, from the tile that holds its data (see 'tile_sources').
+
+        With a 'scale' of 2, 4 or 8 a proxy is assembled: every tile is
+        subsampled (every scale-th pixel) straight into its slice of a buffer
+        of 1/scale of the size. Proxies are not cached, but the decoded tiles
+        are (with a cache).
+
+        With a 'roi' only the tiles that intersect the region are resolved,
+        and only those are decoded (CPY-tiles are followed to their data, see
+        'tile_sources'), so the cost is about the area of the region. Only the
+        region is returned, as a view when the image was constructed already.
+
         Args:
             img_index (int): index of the image
+            scale (int): one of SCALES
+            roi (tuple): (x, y, width, height) of the region, in the
+                coordinates of the (proxy) image. It is clipped to the image.
 
         Returns:
-            numoy.ndarray(): imagedata
+            numoy.ndarray(): imagedata (read-only)
         """
-        image = self.images[img_index]
+        image = self._resolve_image(self.images[img_index])
+        if roi is not None:
+            return self._construct_roi(image, roi, scale)
+        if scale != 1:
+            return self._construct_proxy(image, scale)
+        if image.constructed:  # DBOD-images are always 'constructed'
+            return image.result
+
+        sources = self.tile_sources(image.index)
+        # the tiles that did not change are copied from the previous image,
+        # when that is constructed, so their data is not decoded (or read) again
+        prev_result, unchanged = self._previous_result(image, sources)
+        pinned = set()
+        try:
+            with profiler.measure("assemble") as measurement:
+                # empty (zeros), so empty tiles are skipped. It is cached when
+                # it is complete, so it does not take cache-space while it is built.
+                result = np.zeros(shape=(image.height, image.width, 4), dtype=np.uint8)
+                for tile_index, (src_image_index, src_tile_index) in enumerate(sources.tolist()):
+                    if unchanged[tile_index]:
+                        region = image.tile_region(tile_index)
+                        result[region] = prev_result[region]
+                        continue
+                    self._write_tile(
+                        result, image, tile_index, src_image_index, src_tile_index,
+                        is_cleared=True, pinned=pinned
+                    )
+                measurement.bytes_out = result.nbytes
+        finally:
+            self._unpin(pinned)
 
-        while image.type != "DBOD" and image.first_info in (2, 6):
-            if image.first_info == 2:
-                image = self.images[image.second_info]
-            if image.first_info == 6:
-                image = self.images[image.index - 1]
+        # a constructed image is never changed again: later images copy tiles
+        # from it, and frames are views of it.
+        result.setflags(write=False)
+        image.result = result
+        image.constructed = True
+        return result
 
-        for tile in image.tiles:
-            if image.type == "DBOD":
-                tile_data = tile.data
-            else:  # SRAW
-                tile_data = self._resolve_tile_data(image, tile)
+    def _previous_result(self, image, sources):
+        """ Return the constructed result of the image before 'image' (see
+        _previous_image), and which tiles have the same source in it.
 
-            # # Debugging: print the index of the tile onto the tile.
-            # tile_data[5:25, 1:50, :3] = (0,0,255)
-            # tile_data[5:25, 1:50, 3] = 150
-            # cv2.putText(
-            #     tile_data, str(tile.index), (1,20), cv2.FONT_HERSHEY_SIMPLEX,
-            #     0.5, (0,0,0), 1, cv2.LINE_AA
-            # )
+        Args:
+            image (Image()): the image that is constructed
+            sources (np.ndarray): the tile-sources of 'image'
 
-            x = (tile.index * image.tile_size) % image.max_tilewidth
-            y = (tile.index * image.tile_size) // image.max_tilewidth * image.tile_size
-            image.result[y : y + tile_data.shape[0], x : x + tile_data.shape[1]] = tile_data
-        return image.result
+        Returns:
+            np.ndarray: the result of the previous image, None when that is
+                not constructed
+            list: bool per tile, True when the tile is the same in the
+                previous image
+        """
+        unchanged = [False] * len(sources)
+        if image.type != "SRAW" or image.index == 0:
+            return None, unchanged
+        prev_image = self._previous_image(image)
+        if not prev_image.constructed:
+            return None, unchanged
+        prev_result = prev_image.result  # kept while 'image' is constructed
+        prev_sources = self.tile_sources(prev_image.index)
+        if prev_sources.shape == sources.shape:
+            unchanged = (prev_sources == sources).all(axis=1).tolist()
+        return prev_result, unchanged
+
+    def _construct_proxy(self, image, scale):
+        """ Assemble the proxy of an image, see construct_image. """
+        if image.constructed:
+            return read_only(np.ascontiguousarray(image.result[::scale, ::scale]))
+
+        sources = self.tile_sources(image.index).tolist()
+        pinned = set()
+        try:
+            with profiler.measure("assemble") as measurement:
+                result = np.zeros(
+                    shape=(scaled_size(image.height, scale), scaled_size(image.width, scale), 4),
+                    dtype=np.uint8
+                )
+                for tile_index, (src_image_index, src_tile_index) in enumerate(sources):
+                    self._write_tile(
+                        result, image, tile_index, src_image_index, src_tile_index,
+                        is_cleared=True, scale=scale, pinned=pinned
+                    )
+                measurement.bytes_out = result.nbytes
+        finally:
+            self._unpin(pinned)
+        result.setflags(write=False)
+        return result
+
+    def _construct_roi(self, image, roi, scale):
+        """ Assemble a region of an image, see construct_image. """
+        region_y, region_x = self._roi_region(roi, scale)
+        if image.constructed:
+            result = image.result
+            if scale != 1:
+                return read_only(np.ascontiguousarray(result[::scale, ::scale][region_y, region_x]))
+            return result[region_y, region_x]
+
+        # the tiles that intersect the region are assembled in a block, the
+        # region is cut out of that.
+        tile_size = image.tile_size // scale
+        rows = range(region_y.start // tile_size, (region_y.stop - 1) // tile_size + 1)
+        columns = range(region_x.start // tile_size, (region_x.stop - 1) // tile_size + 1)
+        origin = (rows.start * tile_size, columns.start * tile_size)
+        block_height = min(rows.stop * tile_size, scaled_size(image.height, scale)) - origin[0]
+        block_width = min(columns.stop * tile_size, scaled_size(image.width, scale)) - origin[1]
+
+        sources = self.tile_sources(image.index)
+        pinned = set()
+        try:
+            with profiler.measure("assemble") as measurement:
+                block = np.zeros(shape=(block_height, block_width, 4), dtype=np.uint8)
+                for row in rows:
+                    for column in columns:
+                        tile_index = row * image.num_tiles_x + column
+                        src_image_index, src_tile_index = sources[tile_index].tolist()
+                        self._write_tile(
+                            block, image, tile_index, src_image_index, src_tile_index,
+                            is_cleared=True, scale=scale, origin=origin, pinned=pinned
+                        )
+                measurement.bytes_out = block.nbytes
+        finally:
+            self._unpin(pinned)
+        block.setflags(write=False)
+        return block[
+            region_y.start - origin[0] : region_y.stop - origin[0],
+            region_x.start - origin[1] : region_x.stop - origin[1]
+        ]
+
+    def painted_tiles(self, index: int):
+        """ Return which tiles of a frame are not empty.
+
+        This is known without decoding the RLE-data of the tiles (see
+        ImageTile.is_empty), only DBOD-images are decoded to check.
+
+        Args:
+            index (int): timeline-position (starts with 0)
 
+        Returns:
+            np.ndarray: bool per tile, True when the tile is not empty. None
+                when the layer has no image at this position.
+        """
+        frame_index = self.image_index(index)
+        if frame_index is None:
+            return None
+        image = self._resolve_image(self.images[frame_index])
+        sources = self.tile_sources(image.index).tolist()
+        return np.array(
+            [
+                not self.images[src_image_index].tile_is_empty(src_tile_index)
+                for src_image_index, src_tile_index in sources
+            ],
+            dtype=bool
+        )
 
-    def _resolve_tile_data(self, image, tile):
-        """Resolve tile-data
+    def painted_region(self, index: int, scale=1):
+        """ Return the region of a frame that holds the non-empty tiles.
 
         Args:
-            image (Image()): image-object, for referencing imagedata
-            tile (ImageTile()): tile-object
+            index (int): timeline-position (starts with 0)
+            scale (int): the region in a proxy at 1/scale
 
         Returns:
-            numpy.ndarray(): tile-(image)data
+            tuple: (slice-y, slice-x), None when the frame is empty
         """
+        painted = self.painted_tiles(index)
+        if painted is None or not painted.any():
+            return None
+        image = self.images[0]
+        tile_size = image.tile_size // scale
+        rows, columns = np.divmod(np.flatnonzero(painted), image.num_tiles_x)
+        return (
+            slice(rows.min() * tile_size, (rows.max() + 1) * tile_size),
+            slice(columns.min() * tile_size, (columns.max() + 1) * tile_size)
+        )
+
+    def iter_frames(self, start=0, stop=None, scale=1):
+        """ Iterate over the frames of the timeline.
+
+        One frame-buffer is used for all frames, only the tiles that come
+        from another tile than in the previous frame are written (see
+        'tile_sources'). So the cost is about the amount of changed tiles, not
+        the amount of frames. The buffer is overwritten by the next frame, copy
+        it to keep it. The frames are read-only views of the buffer, a change
+        would show up in the following frames.
 
-        tile.width = self.images[0].tiles[tile.index].width
-        tile.height = self.images[0].tiles[tile.index].height
+        Args:
+            start (int): first timeline-position
+            stop (int): timeline-position to stop at (not included), default
+                is the position after the last image.
+            scale (int): iterate over proxies at 1/scale (see construct_image)
 
-        if tile.type == "RAW":
-            tile_data = tile.data
+        Yields:
+            tuple: timeline-position (int), image-data (numpy.ndarray)
+        """
+        start_frame = self.settings["start_frame"]
+        if stop is None:
+            stop = start_frame + len(self.images)
 
-        elif tile.type == "RLE":
-            tile_data = tile.data
+        frame = np.zeros(
+            shape=(scaled_size(self.height, scale), scaled_size(self.width, scale), 4),
+            dtype=np.uint8
+        )
+        frame_view = read_only(frame)
+        current = None  # tile-sources of the frame in the buffer, None is empty
+        for index in range(start, stop):
+            frame_index = self.image_index(index)
+            if frame_index is None:
+                if current is not None:
+                    frame[...] = 0
+                    current = None
+                yield index, frame_view
+                continue
+
+            image = self._resolve_image(self.images[frame_index])
+            sources = self.tile_sources(image.index)
+            if sources is current:  # a repeated image
+                changed = []
+            elif current is None or current.shape != sources.shape:
+                changed = range(len(sources))
+            else:
+                changed = np.flatnonzero((sources != current).any(axis=1)).tolist()
+
+            pinned = set()
+            try:
+                with profiler.measure("assemble") as measurement:
+                    for tile_index in changed:
+                        src_image_index, src_tile_index = sources[tile_index].tolist()
+                        self._write_tile(
+                            frame, image, tile_index, src_image_index, src_tile_index,
+                            scale=scale, pinned=pinned
+                        )
+                    measurement.bytes_out = len(changed) * (image.tile_size // scale) ** 2 * 4
+            finally:
+                self._unpin(pinned)
+            current = sources
+            yield index, frame_view
+
+    def find_repeats(self, start=0, stop=None):
+        """ Find the frames that are a repeat (hold) of an earlier frame.
+
+        This is done without decoding imagedata: frames are the same when all
+        their tiles come from the same tiles (see 'tile_sources'), that is
+        the case for repeated images (first_info 2 or 6) and images with only
+        CPY-tiles of the previous image. Empty frames (outside of the images of
+        the layer) are repeats of the first empty frame.
 
-        elif tile.type == "CPY":
-            if tile.ref_local_tile == True:
-                ref_tile = image.tiles[tile.ref_local_tile_index]
+        Args:
+            start (int): first timeline-position
+            stop (int): timeline-position to stop at (not included), default
+                is the position after the last image.
 
-                if ref_tile.type == "CPY":
-                    # reference & resolve local tile
-                    local_tile = image.tiles[tile.ref_local_tile_index]
-                    tile_data = self._resolve_tile_data(image, local_tile)
-                else:
-                    # copy the image-data from local image
-                    xpos = (tile.ref_local_tile_index * image.tile_size) % image.max_tilewidth
-                    ypos = (
-                        tile.ref_local_tile_index * image.tile_size // image.max_tilewidth
-                    ) * image.tile_size
-                    tile_data = image.result[
-                        ypos : ypos + image.tile_size, xpos : xpos + image.tile_size
-                    ].copy()
-
-                # # Debugging: print local_tile_index onto the tile
-                # tile_data[20:50, 1:50, :3] = (0, 255, 0)
-                # tile_data[20:50, 1:50, 3] = 200
-                # cv2.putText(
-                #     tile_data, str(tile.ref_local_tile_index), (1,45),
-                #     cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 2, cv2.LINE_AA
-                # )
+        Returns:
+            dict: timeline-position: position of the first frame with the same
+                image (the position itself for a unique frame)
+        """
+        start_frame = self.settings["start_frame"]
+        if stop is None:
+            stop = start_frame + len(self.images)
+
+        first_frames = {}  # tile-sources (as bytes): first timeline-position
+        repeats = {}
+        for index in range(start, stop):
+            frame_index = self.image_index(index)
+            if frame_index is None:
+                key = None
             else:
-                if image.first_info == 6 or image.first_info == image.tile_size:
-                    prev_image = self.images[image.index - 1]
-                elif image.first_info == 2:
-                    prev_image = self.images[image.second_info]
+                image = self._resolve_image(self.images[frame_index])
+                key = self.tile_sources(image.index).tobytes()
+            repeats[index] = first_frames.setdefault(key, index)
+        return repeats
+
+    def _write_tile(
+        self, frame, image, tile_index, src_image_index, src_tile_index, is_cleared=False,
+        scale=1, origin=None, pinned=None
+    ):
+        """ Write the data of a tile into its region of 'frame'.
+
+        Args:
+            frame (numpy.ndarray): frame-buffer of 'image', the tiles before
+                'tile_index' must be written already.
+            image (Image()): the image the tile belongs to
+            tile_index (int): index of the tile
+            src_image_index (int): index of the image that holds the tile-data
+            src_tile_index (int): index of the tile that holds the tile-data
+            is_cleared (bool): True when the region of the tile is empty(zeros)
+                already, empty tiles are skipped then.
+            scale (int): 'frame' is a proxy at 1/scale, the tile is subsampled
+            origin (tuple): (y, x) of 'frame' in the image, when 'frame' is a
+                block of tiles (see construct_image, roi). The tiles before
+                'tile_index' in the block must be written already.
+            pinned (set): the images of which the data is pinned while
+                'frame' is built (see Image.pin), the source-image is added
+                when its data is needed for the tile. Release them with _unpin.
+        """
+        out = frame[shift_region(image.tile_region(tile_index, scale), origin)]
+        src_image = self.images[src_image_index]
+        if pinned is not None and src_image not in pinned and (
+            src_image.tile_needs_data(src_tile_index)
+        ):
+            src_image.pin()
+            pinned.add(src_image)
+        if src_image.tile_is_empty(src_tile_index):
+            if not is_cleared:
+                out[...] = 0
+        elif src_image.constructed:  # this includes DBOD-images
+            out[...] = src_image.result[src_image.tile_region(src_tile_index)][::scale, ::scale]
+        elif src_image is image and src_tile_index < tile_index and (
+            origin is None
+            or region_in(shift_region(image.tile_region(src_tile_index, scale), origin), frame)
+        ):
+            # block-copy of a tile that was already written
+            out[...] = frame[shift_region(image.tile_region(src_tile_index, scale), origin)]
+        elif scale == 1:
+            src_image.tiles[src_tile_index].decode_into(out)
+        else:
+            tile_data = np.empty(shape=src_image.tile_shape(src_tile_index), dtype=np.uint8)
+            src_image.tiles[src_tile_index].decode_into(tile_data)
+            out[...] = tile_data[::scale, ::scale]
+
+        # # Debugging: print the index of the tile onto the tile.
+        # out[5:25, 1:50, :3] = (0,0,255)
+        # out[5:25, 1:50, 3] = 150
+        # cv2.putText(
+        #     out, str(tile_index), (1,20), cv2.FONT_HERSHEY_SIMPLEX,
+        #     0.5, (0,0,0), 1, cv2.LINE_AA
+        # )
+
+    @staticmethod
+    def _unpin(pinned):
+        """ Release the data that was pinned by _write_tile. """
+        for image in pinned:
+            image.unpin()
+
+    def _resolve_image(self, image):
+        """Return the image that holds the data of 'image'.
+
+        Images with first_info 2 or 6 are repeats of another image.
+
+        Args:
+            image (Image()): image-object
+
+        Returns:
+            Image(): the image that is repeated, or 'image' itself
+        """
+        while image.type != "DBOD" and image.first_info in (2, 6):
+            image = self._repeated_image(image)
+        return image
+
+    def _repeated_image(self, image):
+        """Return the image that a repeat (first_info 2 or 6) repeats."""
+        if image.first_info == 2:
+            return self.images[image.second_info]
+        return self.images[image.index - 1]
+
+    def _previous_image(self, image):
+        """Return the image that the (non-local) CPY-tiles of 'image' refer to.
+
+        Args:
+            image (Image()): a SRAW-image
+
+        Returns:
+            Image()
+        """
+        if image.first_info == 6 or image.first_info == image.tile_size:
+            prev_image = self.images[image.index - 1]
+        elif image.first_info == 2:
+            prev_image = self.images[image.second_info]
+        else:
+            raise RuntimeError(f"Unknown 'First info': {image.first_info}")
+        return self._resolve_image(prev_image)
+
+    def tile_sources(self, img_index):
+        """ Return where the data of every tile of an image comes from.
+
+        CPY-tiles refer to other tiles, in the same image or in a previous one,
+        which can be CPY-tiles again. This resolves every tile to the RLE- or
+        RAW-tile that finally holds its data. The index is built once per image
+        (iteratively, so long chains of images don't hit the recursion-limit),
+        and images that repeat another image share its index.
+
+        Args:
+            img_index (int): index of the image
+
+        Returns:
+            np.ndarray: (num_tiles, 2)-array with the (image-index, tile-index)
+                of the tile that holds the data.
+        """
+        sources = self._tile_sources.get(img_index)
+        if sources is None:
+            with profiler.measure("cpy_resolve"):
+                sources = self._build_tile_sources(img_index)
+        return sources
+
+    def _build_tile_sources(self, img_index):
+        """ Build the tile-sources of an image, and of the images it depends on
+        (see 'tile_sources').
+        """
+        stack = [img_index]
+        while stack:
+            index = stack[-1]
+            if index in self._tile_sources:
+                stack.pop()
+                continue
+            if len(stack) > len(self.images) + 1:
+                raise RuntimeError("Circular references between the images of layer.")
+
+            image = self.images[index]
+            source_image = self._resolve_image(image)
+            if source_image is not image:
+                # a repeated image, it shares the index of the image it repeats.
+                if source_image.index in self._tile_sources:
+                    self._tile_sources[index] = self._tile_sources[source_image.index]
+                    stack.pop()
                 else:
-                    raise RuntimeError(f"Unknown 'First info': {image.first_info}")
+                    stack.append(source_image.index)
+                continue
 
-                prev_tile = prev_image.tiles[tile.ref_local_tile_index]
-                tile_data = self._resolve_tile_data(prev_image, prev_tile)
+            if image.type == "DBOD":
+                sources = np.empty(shape=(len(image.tiles), 2), dtype=np.int32)
+                sources[:, 0] = image.index
+                sources[:, 1] = np.arange(len(image.tiles))
+                self._tile_sources[index] = sources
+                stack.pop()
+                continue
+
+            tiles = image.tiles
+            prev_sources = None
+            if any(tile.type == "CPY" and not tile.ref_local_tile for tile in tiles):
+                prev_image = self._previous_image(image)
+                if prev_image.index not in self._tile_sources:
+                    stack.append(prev_image.index)
+                    continue
+                prev_sources = self._tile_sources[prev_image.index]
+
+            sources = np.empty(shape=(len(tiles), 2), dtype=np.int32)
+            for tile in tiles:
+                # follow the local references
+                ref_tile = tile
+                hops = 0
+                while ref_tile.type == "CPY" and ref_tile.ref_local_tile == True:
+                    ref_tile = tiles[ref_tile.ref_local_tile_index]
+                    hops += 1
+                    if hops > len(tiles):
+                        raise RuntimeError(
+                            f"Circular references between the tiles of image {index}."
+                        )
+                if ref_tile.type == "CPY":
+                    sources[tile.index] = prev_sources[ref_tile.ref_local_tile_index]
+                else:
+                    sources[tile.index] = (index, ref_tile.index)
+            self._tile_sources[index] = sources
+            stack.pop()
 
-        return tile_data
+        return self._tile_sources[img_index]
 
 
 class Image(object):
     def __init__(self, image_type, index, width, height, tile_size=64):
         self.type = image_type
         self.index = index
-        self._raw_data = bytes()
+        self.tvptree = None  # TvpProject, to read the chunk-data from
+        self.data_offset = 0  # Position(index) of the chunk-data in file
+        self.data_size = 0
+        self.zchk_workers = None
+        self.cache = None  # LRUCache for the result, and the tiles
+        self.data_cache = None  # LRUCache for the chunk-data (see 'raw_data')
+        self.is_zipped = False  # the chunk-data is ZCHK, 'type' is the unzipped type
+        self._raw_data = None
+        self._pinned_raw_data = None  # see 'pin'
+        self._pinned_result = None
+        self._pins = 0
+        self._head = None  # start of the chunk-data, see 'read_head'
         self.width = width
         self.height = height
         self._tiles = []
         self.tile_size = tile_size
-        self._result = np.ndarray([])
+        self._result = None
+        self._constructed = False
         self._first_info = None
         self._second_info = None
 
@@ -367,44 +1036,330 @@ class Image(object):
         self.num_tiles_y = self.height // self.tile_size + int(
             self.height % self.tile_size > 0
         )
-        self.num_tiles = self.num_tiles_x * self.tile_size
+        self.num_tiles = self.num_tiles_x * self.num_tiles_y
         self.max_tilewidth = self.num_tiles_x * self.tile_size
 
+    def tile_position(self, tile_index):
+        """ Return the (x, y)-position of a tile in the image.
+
+        Args:
+            tile_index (int): index of the tile
+
+        Returns:
+            tuple: x, y
+        """
+        x = (tile_index * self.tile_size) % self.max_tilewidth
+        y = (tile_index * self.tile_size) // self.max_tilewidth * self.tile_size
+        return x, y
+
+    def tile_is_empty(self, tile_index):
+        """ Check if a tile of this image is empty (all pixels are 0).
+
+        For SRAW-tiles this is known from the RLE-data. DBOD-images are
+        decoded, then all tiles are checked at once.
+
+        Args:
+            tile_index (int): index of the tile
+
+        Returns:
+            bool
+        """
+        tile = self.tiles[tile_index]
+        if tile.is_empty is None and self.type == "DBOD":
+            result = self.result
+            # pad to whole tiles, and check per tile if any byte is set
+            painted = np.zeros(
+                shape=(self.num_tiles_y * self.tile_size, self.max_tilewidth), dtype=bool
+            )
+            painted[: self.height, : self.width] = result.any(axis=2)
+            painted = painted.reshape(
+                self.num_tiles_y, self.tile_size, self.num_tiles_x, self.tile_size
+            ).any(axis=(1, 3)).ravel()
+            for dbod_tile, tile_painted in zip(self.tiles, painted.tolist()):
+                dbod_tile.is_empty = not tile_painted
+        return bool(tile.is_empty)
+
+    def tile_needs_data(self, tile_index):
+        """ Check if the data of this image (see 'pin') is needed to copy or
+        decode a tile: the tile is not known to be empty, and an RLE-tile is
+        not in the cache.
+
+        Args:
+            tile_index (int): index of the tile
+
+        Returns:
+            bool
+        """
+        tile = self.tiles[tile_index]
+        if tile._is_empty:
+            return False
+        if self.constructed:
+            return True
+        if not tile.rle_size:  # CPY-tiles have no data of their own
+            return False
+        return tile._is_empty is None or tile.cache is None or tile not in tile.cache
+
+    def _get_result(self):
+        if self._pinned_result is not None:
+            return self._pinned_result
+        if self.cache is not None:
+            return self.cache.get(self)
+        return self._result
+
+    def tile_region(self, tile_index, scale=1):
+        """ Return the region of a tile in the image.
+
+        Args:
+            tile_index (int): index of the tile
+            scale (int): the region in a proxy at 1/scale
+
+        Returns:
+            tuple: (slice-y, slice-x), to index the result with
+        """
+        x, y = self.tile_position(tile_index)
+        x, y, size = x // scale, y // scale, self.tile_size // scale
+        return slice(y, y + size), slice(x, x + size)
+
+    def tile_shape(self, tile_index):
+        """ Return the shape of the data of a tile: (height, width, 4), the
+        tiles at the right and bottom edge can be smaller than tile_size.
+        """
+        x, y = self.tile_position(tile_index)
+        return min(self.tile_size, self.height - y), min(self.tile_size, self.width - x), 4
+
     @property
     def result(self):
         """ This will store the final image-data(np.ndarray).
         It is empty when the class is initialized. Gets filled when accessed.
 
+        DBOD-images are decoded when accessed. With a cache, the result can be
+        dropped, it is then created again on the next access.
         """
-        if not self._result.shape:
-            self._result = np.zeros(shape=(self.height, self.width, 4), dtype=np.uint8)
-        return self._result
+        result = self._get_result()
+        if result is None:
+            if self.type == "ZCHK":
+                _trigger_unzip = self.raw_data  # this sets the actual type
+            if self.type == "DBOD":
+                result = decoders.decode_DBOD(self.raw_data, self.width, self.height)
+                result.setflags(write=False)  # like constructed SRAW-images
+                if self.data_cache is not None:
+                    # the result holds all of it, the chunk-data is read again
+                    # when the result gets dropped
+                    self.data_cache.discard(self._raw_data_key)
+            else:
+                result = np.zeros(shape=(self.height, self.width, 4), dtype=np.uint8)
+                self._constructed = False
+            self.result = result
+        return result
+
+    @result.setter
+    def result(self, value):
+        if self.cache is not None:
+            self.cache.put(self, value)
+        else:
+            self._result = value
 
     @property
-    def raw_data(self):
-        if self.type == "ZCHK":
-            self._raw_data = decoders.decode_ZCHK(self._raw_data)
-            self.type = bytes(struct.unpack_from("BBBB", self._raw_data)).decode(
-                "ascii"
-            )
-            del self._raw_data[:8]
+    def constructed(self):
+        """ True when 'result' holds the complete image.
+
+        DBOD-images are always complete, their result is the decoded image.
+        """
+        if self.type == "DBOD":
+            return True
+        if self.cache is not None:
+            return self._constructed and (self._pinned_result is not None or self in self.cache)
+        return self._constructed
+
+    @constructed.setter
+    def constructed(self, value):
+        self._constructed = value
+
+    def _read_raw_data(self):
+        """Read the chunk-data of this image from file, ZCHK-data is unzipped.
+
+        Returns:
+            bytes|bytearray|memoryview: the chunk-data
+        """
+        raw_data = self.tvptree.read_data(self.data_offset, self.data_size)
+        if self.type == "ZCHK" or self.is_zipped:
+            raw_data = self._unzip(raw_data)
+        return raw_data
+
+    def _unzip(self, data):
+        """ Unzip ZCHK-data, this sets the actual type (DBOD or SRAW).
+
+        Args:
+            data (bytes|memoryview): the ZCHK-chunk-data
+
+        Returns:
+            bytearray: the unzipped chunk-data (without the type-header)
+        """
+        return self._strip_type(decoders.decode_ZCHK(data, self.zchk_workers))
+
+    def _unzip_head(self, size, head=None):
+        """ Read and unzip only the ZCHK-blocks that hold the first 'size' bytes.
+
+        Args:
+            size (int): amount of bytes, without the type-header
+            head (bytearray): the start that was unzipped before (see
+                'read_head'), its blocks are not read again.
+
+        Returns:
+            bytearray: the start of the unzipped chunk-data (without the
+                type-header), whole blocks.
+        """
+        def read(offset, size):
+            return self.tvptree.read_data(self.data_offset + offset, size)
+
+        if head is None:
+            return self._strip_type(decoders.decode_ZCHK_head(read, size + 8))
+        return head + decoders.decode_ZCHK_head(read, size + 8, skip=len(head) + 8)
+
+    def _strip_type(self, raw_data):
+        """ Set the actual type from the header of unzipped data, and remove it. """
+        self.type = bytes(struct.unpack_from("BBBB", raw_data)).decode("ascii")
+        self.is_zipped = True
+        del raw_data[:8]
+        return raw_data
+
+    def read_head(self, size):
+        """ Return the start of the chunk-data.
+
+        When the chunk-data was not read yet, only its start is read (for
+        ZCHK-data only the blocks that hold it), and kept for the next call.
+        This sets the actual type of ZCHK-images, and the infos of
+        SRAW-images (see 'first_info') too.
+
+        Args:
+            size (int): amount of bytes
+
+        Returns:
+            bytes|bytearray|memoryview: at least 'size' bytes (when the chunk
+                has that many), it can be more.
+        """
+        raw_data = self._get_raw_data()
+        if raw_data is not None:
+            return raw_data[:size]
+        head = self._get_head()
+        if head is not None and len(head) >= size:
+            return head
+        if self.type == "ZCHK" or self.is_zipped:
+            head = self._unzip_head(size, head)
+        else:
+            head = self.tvptree.read_data(self.data_offset, min(size, self.data_size))
+        self._set_head(head)
+        if self.type == "SRAW" and len(head) >= 8:
+            self._first_info, self._second_info = struct.unpack_from(">II", head)
+        return head
+
+    @property
+    def thumbnail_data(self):
+        """ The thumbnail that is stored in SRAW-data, before the tiles.
+
+        Only the start of the chunk-data is read, no tiles are created or
+        decoded. DBOD-images and repeats (first_info 2 or 6) have no
+        thumbnail, this is empty for those.
+        """
+        head = self.read_head(8)
+        if self.type != "SRAW":
+            return b""
+        first_info, thumb_size = struct.unpack_from(">II", head)
+        if first_info in (2, 6):
+            return b""
+        if len(head) < 8 + thumb_size:
+            head = self.read_head(8 + thumb_size)
+        return bytes(head[8 : 8 + thumb_size])
+
+    def _get_raw_data(self):
+        if self._pinned_raw_data is not None:
+            return self._pinned_raw_data
+        if self.data_cache is not None:
+            return self.data_cache.get(self._raw_data_key)
         return self._raw_data
 
+    def _get_head(self):
+        if self.data_cache is not None:
+            return self.data_cache.get(self._head_key)
+        return self._head
+
+    def _set_head(self, head):
+        if self.data_cache is not None:
+            self.data_cache.put(self._head_key, head)
+        else:
+            self._head = head
+
+    @property
+    def _head_key(self):
+        return (self, "head")
+
+    @property
+    def _raw_data_key(self):
+        return (self, "raw_data")
+
+    @property
+    def raw_data(self):
+        """ The chunk-data of the image, read (and unzipped) on first access.
+
+        With a data-cache the chunk-data can be dropped, it is read from file
+        again on the next access.
+        """
+        raw_data = self._get_raw_data()
+        if raw_data is None:
+            raw_data = self._read_raw_data()
+            self.raw_data = raw_data
+        return raw_data
+
     @raw_data.setter
     def raw_data(self, value):
-        self._raw_data = value
+        if self.data_cache is not None:
+            self.data_cache.put(self._raw_data_key, value)
+            self.data_cache.discard(self._head_key)
+        else:
+            self._raw_data = value
+            self._head = None  # the chunk-data holds the head
+
+    def pin(self):
+        """ Keep the data of this image in memory till unpin, also when it is
+        dropped from the caches, so the tiles of an image that is being built
+        come from one read (or decode) of it: the result of a constructed
+        image (and of DBOD-images), else the chunk-data. Pins are counted.
+        """
+        if not self._pins:
+            if self.constructed:
+                self._pinned_result = self.result
+            else:
+                self._pinned_raw_data = self.raw_data
+        self._pins += 1
+
+    def unpin(self):
+        """ Release a pin of 'pin'. """
+        self._pins -= 1
+        if not self._pins:
+            self._pinned_raw_data = None
+            self._pinned_result = None
+
+    def release_raw_data(self):
+        """ Drop the chunk-data (and the head, see 'read_head'), it is read
+        from file again when it is needed. The tiles keep their positions.
+        """
+        if self.data_cache is not None:
+            self.data_cache.discard(self._raw_data_key)
+            self.data_cache.discard(self._head_key)
+        self._raw_data = None
+        self._head = None
 
     @property
     def first_info(self):
         # First info tells us if this image repeats last image or a specific one.
         #
-        if not self._first_info:
+        if self._first_info is None:
             self._first_info = struct.unpack_from(">I", self.raw_data, 0)[0]
         return self._first_info
 
     @property
     def second_info(self):
-        if not self._second_info:
+        if self._second_info is None:
             self._second_info = struct.unpack_from(">I", self.raw_data, 4)[0]
         return self._second_info
 
@@ -421,57 +1376,55 @@ class Image(object):
     def create_tiles(self):
         _trigger_unzip = self.first_info  # TODO: improve this
         if self.type == "DBOD":
-            image_data = decoders.decode_DBOD(self.raw_data, self.width, self.height)
+            # The imagedata of these tiles is in the (decoded) result.
             for tile_index in range(0, self.num_tiles):
                 tile = ImageTile("RAW", self.index, tile_index)
-                xpos = (tile_index * self.tile_size) % self.max_tilewidth
-                ypos = (
-                    tile_index * self.tile_size // self.max_tilewidth * self.tile_size
-                )
-                tile.data = image_data[
-                    ypos : ypos + self.tile_size, xpos : xpos + self.tile_size
-                ]
-                tile.width = tile.data.shape[1]
-                tile.height = tile.data.shape[0]
+                xpos, ypos = self.tile_position(tile_index)
+                tile.width = min(self.tile_size, self.width - xpos)
+                tile.height = min(self.tile_size, self.height - ypos)
                 self._tiles.append(tile)
 
         if self.type == "SRAW":
             # precompile unpack_from to improve speed
             unpack_uint = struct.Struct('>I').unpack_from
+            raw_data = self.raw_data
 
             data_offset = 0
-            # total_length = len(self.raw_data)
+            # total_length = len(raw_data)
 
             # TODO: Don't assume tile_size is 64
-            _tile_size = unpack_uint(self.raw_data, data_offset)[0]
+            _tile_size = unpack_uint(raw_data, data_offset)[0]
             data_offset += 4
 
-            thumb_size = unpack_uint(self._raw_data, data_offset)[0]
+            thumb_size = unpack_uint(raw_data, data_offset)[0]
             data_offset += 4
-            _thumbdata = self._raw_data[data_offset : data_offset + thumb_size]
+            _thumbdata = raw_data[data_offset : data_offset + thumb_size]
             data_offset += thumb_size
 
-            tile_amount = unpack_uint(self._raw_data, data_offset)[0]
+            tile_amount = unpack_uint(raw_data, data_offset)[0]
             data_offset += 4
             for tile_index in range(tile_amount):
-                tile = ImageTile("", self.index, tile_index)
-                magicnumber = unpack_uint(self.raw_data, data_offset)[0]
+                tile = ImageTile("", self.index, tile_index, self.cache)
+                magicnumber = unpack_uint(raw_data, data_offset)[0]
                 data_offset += 4
                 if magicnumber == 0:
                     tile.type = "CPY"
                     tile.ref_local_tile = not bool(
-                        unpack_uint(self.raw_data, data_offset)[0]
+                        unpack_uint(raw_data, data_offset)[0]
                     )
 
                     data_offset += 4
-                    tile.ref_local_tile_index = unpack_uint(self.raw_data, data_offset)[0]
+                    tile.ref_local_tile_index = unpack_uint(raw_data, data_offset)[0]
                     data_offset += 4
 
                 else:
                     tile.type = "RLE"
-                    size = magicnumber
-                    tile.rle_data = self.raw_data[data_offset : data_offset + size]
-                    data_offset += size
+                    # only the position is kept, the data is a view of the
+                    # chunk-data (see ImageTile.rle_data)
+                    tile.image = self
+                    tile.rle_offset = data_offset
+                    tile.rle_size = magicnumber
+                    data_offset += magicnumber
 
                 self._tiles.append(tile)
 
@@ -491,18 +1444,72 @@ class ImageTile(object):
         self.width = 0
         self.height = 0
         self.cache = tile_cache
-        self.rle_data = bytes()
-        self._data = np.ndarray([])
+        self.image = None  # Image that holds the RLE-data
+        self.rle_offset = 0  # position of the RLE-data in the chunk-data of 'image'
+        self.rle_size = 0
+        self._is_empty = None
+
+    @property
+    def rle_data(self):
+        """ The RLE-data of the tile.
+
+        This is a view of the chunk-data of the image (no copy), so it is
+        dropped together with that (see Image.raw_data).
+        """
+        if not self.rle_size:
+            return b""
+        return memoryview(self.image.raw_data)[
+            self.rle_offset : self.rle_offset + self.rle_size
+        ]
 
     @property
     def data(self):
-        if self.rle_data:
-            self._data = decoders.decode_DBOD(self.rle_data, self.width, self.height)
-            self.rle_data = bytes()
+        """ The decoded tile (see decode_into), None for tiles without
+        RLE-data (CPY-tiles, and the tiles of DBOD-images).
+        """
+        if not self.rle_size:
+            return None
+        data = np.empty(shape=self.image.tile_shape(self.index), dtype=np.uint8)
+        self.decode_into(data)
+        return data
+
+    @property
+    def is_empty(self):
+        """ True when all pixels of the tile are 0, None when unknown.
+
+        For RLE-tiles this is checked on the RLE-data, without decoding it.
+        """
+        if self._is_empty is None and self.rle_size:
+            self._is_empty = decoders.is_empty_RLE(self.rle_data)
+        return self._is_empty
+
+    @is_empty.setter
+    def is_empty(self, value):
+        self._is_empty = value
+
+    def decode_into(self, out):
+        """ Decode the tile-data straight into 'out'.
+
+        With a cache, the decoded tile is cached, so tiles that are referenced
+        by many images are only decoded once.
+
+        Args:
+            out (numpy.ndarray): the slice of a frame-buffer the tile belongs to
+        """
+        self.width = out.shape[1]
+        self.height = out.shape[0]
+        if not self.rle_size:
+            raise RuntimeError(
+                f"Tile {self.index} of image {self.image_index} has no RLE-data to decode."
+            )
 
-        return self._data
+        if self.cache is not None:
+            cached = self.cache.get(self)
+            if cached is not None:
+                out[...] = cached
+                return
 
-    @data.setter
-    def data(self, data):
-        self._data = data
+        decoders.decode_DBOD_into(self.rle_data, out)
+        if self.cache is not None:
+            self.cache.put(self, out.copy())
 
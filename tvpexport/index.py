@@ -0,0 +1,145 @@
+"""A sidecar-index of the structure of a project-file.
+
+Parsing the node-tree (TvpProject.process) and walking the chunks of the
+clip-data (Clip.read_clip_data) has to go through the whole file. The
+resulting offsets & sizes are stored in a small json-file, so reopening an
+unchanged project can skip that scan.
+
+The index is only used when the size, modification-time and a hash of the
+start of the project-file are the same as when the index was written.
+
+Issued under the "do what you like with it - I take no responsibility" licence
+"""
+
+import os
+import sys
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Bump this when the content of the index changes, old indices are ignored then.
+INDEX_VERSION = 1
+INDEX_EXTENSION = ".index.json"
+# amount of bytes at the start of the project-file that is hashed
+HEADER_HASH_SIZE = 65536
+
+
+def index_path(file_path, index_dir=None):
+    """ Return the path of the index of a project-file.
+
+    Args:
+        file_path (str): path of the project-file
+        index_dir (str): directory for the index, None puts it next to the
+            project-file
+
+    Returns:
+        str
+    """
+    if index_dir is None:
+        return file_path + INDEX_EXTENSION
+    # files with the same name in different directories get their own index
+    path_hash = hashlib.sha1(os.path.abspath(file_path).encode("utf8")).hexdigest()
+    file_name = f"{os.path.basename(file_path)}.{path_hash[:12]}{INDEX_EXTENSION}"
+    return os.path.join(index_dir, file_name)
+
+
+def file_key(file_obj):
+    """ Return what identifies the version of a project-file.
+
+    Args:
+        file_obj: the opened project-file
+
+    Returns:
+        dict: size, mtime and header_hash of the file
+    """
+    stat = os.fstat(file_obj.fileno())
+    file_obj.seek(0, 0)
+    header_hash = hashlib.sha1(file_obj.read(HEADER_HASH_SIZE)).hexdigest()
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "header_hash": header_hash,
+    }
+
+
+def node_to_list(node):
+    """ Convert a node-tree to nested lists: [type, size, data_offset, children]. """
+    return [
+        node.type, node.size, node.data_offset,
+        [node_to_list(child) for child in node.children]
+    ]
+
+
+def node_from_list(values, node_class):
+    """ Create a node-tree from nested lists (see node_to_list).
+
+    Args:
+        values (list): [type, size, data_offset, children]
+        node_class (type): class of the nodes
+
+    Returns:
+        the root-node
+    """
+    root = node_class()
+    stack = [(root, values)]
+    while stack:
+        node, (node.type, node.size, node.data_offset, children) = stack.pop()
+        for child_values in children:
+            child = node_class()
+            node.add_child(child)
+            stack.append((child, child_values))
+    return root
+
+
+def load_index(path, key):
+    """ Load an index, if it exists and belongs to the same version of the file.
+
+    Args:
+        path (str): path of the index
+        key (dict): the file_key of the project-file
+
+    Returns:
+        dict: the index, None when there is no (valid) index
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError) as error:
+        logger.warning(f"Could not read index {path}: {error}")
+        return None
+    if index.get("version") != INDEX_VERSION or index.get("file") != key:
+        logger.debug(f"Index {path} is outdated.")
+        return None
+    return index
+
+
+def save_index(path, index):
+    """ Write an index, failing to do so is not fatal.
+
+    The index is written to a temporary file first, so processes that read it
+    at the same time never see a partial index.
+
+    Args:
+        path (str): path of the index
+        index (dict): the index
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(temp_path, "w") as index_file:
+            json.dump(index, index_file, separators=(",", ":"))
+        os.replace(temp_path, path)
+    except OSError as error:
+        logger.warning(f"Could not write index {path}: {error}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return
+    logger.debug(f"Index was written to {path}.")
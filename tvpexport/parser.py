@@ -7,10 +7,13 @@ Issued under the "do what you like with it - I take no responsibility" licence.
 
 import sys
 import re
+import mmap
 import struct
 import codecs
 import logging
 from . import decoders
+from . import index as project_index
+from .profiling import profiler
 
 logger = logging.getLogger(__name__)
 handler = logging.StreamHandler(sys.stdout)
@@ -18,6 +21,16 @@ formatter = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
+# a node-header: 4 bytes type, 6 bytes ?, 6 bytes validation, 8 bytes size
+NODE_HEADER_SIZE = 24
+VALID_HEADER_MAGICS = (
+    bytes((0x00, 0x0F, 0x1F, 0x02, 0x19, 0x1B)),
+    bytes((0x00, 0x10, 0x5A, 0xAF, 0xAA, 0xAB)),
+)
+unpack_node_size = struct.Struct(">Q").unpack_from
+# headers (of nodes and chunks) are read in blocks of this size, see HeaderReader
+HEADER_BLOCK_SIZE = 16 * 1024
+
 
 class Node(object):
     """ A tree-item for the tvpaint-project-tree-structure.
@@ -42,6 +55,41 @@ class Node(object):
         self.data = data
 
 
+class HeaderReader(object):
+    """ Reads the headers of a project-file in blocks.
+
+    Scanning the nodes or chunks needs many small reads (a header each), these
+    are served from one block of HEADER_BLOCK_SIZE bytes, a header outside
+    of the block reads the block at its position. Memory-mapped files are
+    sliced directly.
+    """
+
+    def __init__(self, tvptree, block_size=HEADER_BLOCK_SIZE):
+        self.tvptree = tvptree
+        self.block_size = block_size
+        self._block = b""
+        self._block_offset = 0
+
+    def read(self, offset, size):
+        """ Return 'size' bytes at 'offset' in the file (less at the end).
+
+        Args:
+            offset(int): position in file
+            size(int): amount of bytes
+
+        Returns:
+            bytes|memoryview
+        """
+        if self.tvptree._buffer is not None:
+            return self.tvptree._buffer[offset : offset + size]
+        start = offset - self._block_offset
+        if start < 0 or start + size > len(self._block):
+            self._block = self.tvptree.read_data(offset, max(size, self.block_size))
+            self._block_offset = offset
+            start = 0
+        return self._block[start : start + size]
+
+
 class TvpProject(object):
     """ Class for a tvpaint-data-tree.
 
@@ -70,9 +118,18 @@ class TvpProject(object):
 
     This class provides a 'root'-object that contains this tree, so we can
     access its data.
+
+    The file is opened once and kept open, all data is read through that one
+    handle (see 'read_data'). With 'use_mmap' the file is memory-mapped and
+    'read_data' returns zero-copy memoryview-slices of the mapping.
+
+    With 'use_index' the node-tree and the chunk-positions of the clips are
+    stored in a sidecar-index (see index), next to the file or in
+    'index_dir'. When the file did not change, the tree is read from the index
+    instead of scanning the file.
     """
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, use_mmap=False, use_index=False, index_dir=None):
         self.headers = {
             "project": {
                 "header": (0x33, 0x84, 0x78, 0x0E),
@@ -155,10 +212,47 @@ class TvpProject(object):
                 "is_data": True
             }
         }
+        # header-bytes: (type, is_data), for a direct lookup while scanning
+        self._header_types = {
+            bytes(data["header"]): (_type, data["is_data"])
+            for _type, data in self.headers.items()
+        }
+        self.node_index = {}  # type: nodes of that type, in file-order
         self.file_path = file_path
-        self.root = Node()
-        with open(self.file_path, "rb") as file_obj:
-            self.process(file_obj, self.root)
+        self.use_mmap = use_mmap
+        self._file_obj = open(self.file_path, "rb")
+        self._mmap = None
+        self._buffer = None
+        if self.use_mmap:
+            self._mmap = mmap.mmap(self._file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+            self._buffer = memoryview(self._mmap)
+
+        self.use_index = use_index or index_dir is not None
+        self.index_path = None
+        self.index = None
+        if self.use_index:
+            self.index_path = project_index.index_path(self.file_path, index_dir)
+            key = project_index.file_key(self._file_obj)
+            self.index = project_index.load_index(self.index_path, key)
+            if self.index is None:
+                self.index = {
+                    "version": project_index.INDEX_VERSION,
+                    "file": key,
+                    "clips": {},
+                }
+
+        if self.index is not None and "nodes" in self.index:
+            logger.debug(f"Node-tree was read from index {self.index_path}.")
+            self.root = project_index.node_from_list(self.index["nodes"], Node)
+            self._build_node_index()
+        else:
+            self.root = Node()
+            self.file_obj.seek(0, 0)
+            with profiler.measure("scan"):
+                self.process(self.file_obj, self.root)
+            if self.index is not None:
+                self.index["nodes"] = project_index.node_to_list(self.root)
+                self.save_index()
 
         self.metadata = self.read_project_metadata()
         self.tvpaint_version = list(
@@ -166,36 +260,148 @@ class TvpProject(object):
         )
 
 
-    def get_scene_tree(self, scene_index=0):
-        """Returns scene-node.
+    def __enter__(self):
+        return self
 
-        TODO: scenes might need their own class
+    def __exit__(self, *_args):
+        self.close()
+
+    @property
+    def file_obj(self):
+        """ The shared file-object, this is the mmap-object when memory-mapped.
+
+        Both support read(), seek() and tell().
+        """
+        if self._mmap is not None:
+            return self._mmap
+        return self._file_obj
 
-        TODO: I don't have an example with multiple scenes, so the setup of the
-        scenes-list is unclear to me. For now I assume that scene_index=0 returns
-        the first scene-item.
+    def read_data(self, offset, size):
+        """Read a block of data from the project-file.
 
+        Args:
+            offset(int): position in file
+            size(int): amount of bytes
+
+        Returns:
+            memoryview: a slice of the mapped file, when memory-mapped
+            bytes: the data, otherwise
         """
+        with profiler.measure("io", size) as measurement:
+            if self._buffer is not None:
+                data = self._buffer[offset : offset + size]
+            else:
+                self._file_obj.seek(offset, 0)
+                data = self._file_obj.read(size)
+            measurement.bytes_out = len(data)
+        return data
+
+    def save_index(self):
+        """ Write the sidecar-index, when 'use_index' is set. """
+        if self.index is not None:
+            project_index.save_index(self.index_path, self.index)
+
+    def get_clip_chunks(self, scene_index, clip_index):
+        """ Return the indexed chunk-positions of a clip.
 
-        scenes_index = -1
-        for idx, node in enumerate(self.root.children):
-            if node.type == "scene":
-                scenes_index = idx
+        Args:
+            scene_index(int)
+            clip_index(int)
 
-        if scenes_index < 0:
+        Returns:
+            list: [ident, data_offset, size]-items, None when not indexed
+        """
+        if self.index is None:
+            return None
+        return self.index["clips"].get(f"{scene_index},{clip_index}")
+
+    def set_clip_chunks(self, scene_index, clip_index, chunks):
+        """ Store the chunk-positions of a clip in the sidecar-index.
+
+        Args:
+            scene_index(int)
+            clip_index(int)
+            chunks(list): [ident, data_offset, size]-items
+        """
+        if self.index is None:
+            return
+        self.index["clips"][f"{scene_index},{clip_index}"] = chunks
+        self.save_index()
+
+    def close(self):
+        """ Close the file (and the memory-map). """
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Slices of the map are still in use somewhere, the map gets
+                # closed when those are garbage-collected.
+                logger.debug("Memory-map is still referenced, not closed.")
+            self._mmap = None
+        self._file_obj.close()
+
+    def get_scene_trees(self):
+        """Return the scene-nodes of the project, in file-order.
+
+        Returns:
+            list:   scene(Node)-objects
+        """
+        scenes = [node for node in self.root.children if node.type == "scene"]
+        if not scenes:
             raise RuntimeError(
                 "Project-tree does not have a 'scenes'-node. The tvp-version is probably unsupported"
             )
-        return self.root.children[scenes_index:][scene_index]
+        return scenes
+
+
+    def get_clip_trees(self, scene_index=0):
+        """Return the clip-nodes of a scene, in file-order.
+
+        The first child of a scene is the scene-info, the clips follow.
+
+        Args:
+            scene_index(int)
+
+        Returns:
+            list:   clip(Node)-objects
+        """
+        scene = self.get_scene_tree(scene_index)
+        return [node for node in scene.children if node.type == "clip"]
+
+
+    def get_clip_indices(self):
+        """Return the (scene_index, clip_index) of every clip in the project.
+
+        Returns:
+            list:   (scene_index, clip_index)-tuples
+        """
+        return [
+            (scene_index, clip_index)
+            for scene_index in range(len(self.get_scene_trees()))
+            for clip_index in range(len(self.get_clip_trees(scene_index)))
+        ]
+
+
+    def get_scene_tree(self, scene_index=0):
+        """Returns scene-node.
+
+        TODO: scenes might need their own class
+
+        Args:
+            scene_index(int)
+
+        Returns:
+            Node():     a scene-node
+        """
+        return self.get_scene_trees()[scene_index]
 
 
     def get_clip_tree(self, scene_index=0, clip_index=0):
         """Return clip-node.
 
-        TODO: I don't have an example with multiple scenes/clips, so the setup of the
-        scenes&clips-list is unclear to me. For now I assume that scene_index=0 &
-        clip_index=0 returns the first clip-item of the first scene.
-
         Args:
             scene_index(int)
             clip_index(int)
@@ -203,7 +409,7 @@ class TvpProject(object):
         Returns:
             Node():     a clip-node
         """
-        return self.get_scene_tree(scene_index).children[1:][clip_index]
+        return self.get_clip_trees(scene_index)[clip_index]
 
 
     def read_scene_metadata(self, scene_data):
@@ -220,24 +426,13 @@ class TvpProject(object):
         """
         # scene-info-node is the first child of a scene-Node
         scene = scene_data.children[0]
-
-        with open(self.file_path, 'rb') as file_obj:
-            d_offset = scene.data_offset
-            size = scene.size
-            file_obj.seek(d_offset,0)
-            data = file_obj.read(size)
-
+        data = self.read_data(scene.data_offset, scene.size)
         return decoders.parse_utf16_dictdata(data)
 
 
     def read_project_metadata(self):
         project = self.root.children[0]
-        with open(self.file_path, 'rb') as file_obj:
-            d_offset = project.data_offset
-            size = project.size
-            file_obj.seek(d_offset,0)
-            data = file_obj.read(size)
-
+        data = self.read_data(project.data_offset, project.size)
         info = decoders.parse_utf16_dictdata(data)
         # History (if present) data is obfuscated with rot13-method, so decrypt it:
         for k, v in info.items():
@@ -247,21 +442,81 @@ class TvpProject(object):
         return info
 
 
+    def read_thumbnail_metadata(self):
+        """Get the info of the thumbnail that tvpaint stores with the project.
+
+        Returns:
+            dict:   thumbnail-info (like its size), empty when there is none
+        """
+        nodes = self.node_index.get("utf16-thumbnailinfo")
+        if not nodes:
+            return {}
+        data = self.read_data(nodes[0].data_offset, nodes[0].size)
+        return decoders.parse_utf16_dictdata(data)
+
+
+    def thumbnail_size(self):
+        """Get the size of the thumbnail, from the thumbnail-info.
+
+        The keys of the thumbnail-info are not documented, 'Width' and
+        'Height' are matched case-insensitive (best-effort).
+
+        Returns:
+            tuple: (width, height), None when the info has no such size
+        """
+        info = {key.lower(): value for key, value in self.read_thumbnail_metadata().items()}
+        try:
+            return int(info["width"]), int(info["height"])
+        except (KeyError, ValueError):
+            return None
+
+
+    def read_thumbnail_data(self):
+        """Get the thumbnail-data that tvpaint stores with the project, as it
+        is stored (not decoded), with its info.
+
+        Returns:
+            bytes: thumbnail-data, None when there is no thumbnail
+            dict: thumbnail-info (see read_thumbnail_metadata)
+        """
+        nodes = self.node_index.get("thumbnail-data")
+        if not nodes:
+            return None, {}
+        data = bytes(self.read_data(nodes[0].data_offset, nodes[0].size))
+        return data, self.read_thumbnail_metadata()
+
+
+    def read_thumbnail(self):
+        """Get the thumbnail that tvpaint stores with the project.
+
+        Only the thumbnail-nodes are read, so this is fast on any project.
+        The format of the thumbnail is not documented, it is decoded
+        best-effort with the size of the thumbnail-info (see
+        decoders.decode_thumbnail); read_thumbnail_data gives the data as it
+        is stored.
+
+        Returns:
+            np.ndarray: thumbnail-image, None when there is no thumbnail
+
+        Raises:
+            ValueError: when the size is unknown, or the data does not fit it
+        """
+        data, info = self.read_thumbnail_data()
+        if data is None:
+            return None
+        size = self.thumbnail_size()
+        if size is None:
+            raise ValueError(f"Unknown size of the project-thumbnail, the info is: {info}")
+        return decoders.decode_thumbnail(data, *size)
+
+
     def validate_header(self, headerdata):
         """ Check if the header is valid
 
         Returns:
             True, if the headerdata is valid
         """
-
-        d = list(headerdata[10:16])
-        if d in (
-            [0x00, 0x0F, 0x1F, 0x02, 0x19, 0x1B],
-            [0x00, 0x10, 0x5A, 0xAF, 0xAA, 0xAB],
-        ):
-            return True
-        else:
-            return False
+        return bytes(headerdata[10:16]) in VALID_HEADER_MAGICS
 
 
     def printnode(self, node, indent=0):
@@ -289,49 +544,97 @@ class TvpProject(object):
             str:    name of the Node-type
             bool:   If True the header is of a data-type, else a container-type
         """
+        return self._header_types.get(bytes(header[0:4]), ("", True))
+
+
+    def _read_node_header(self, reader, node, offset):
+        """ Read the header of a node, and set its type and size.
+
+        Args:
+            reader(HeaderReader): reads the headers of this project
+            node(Node): node-object
+            offset(int): position of the header in the file
+
+        Returns:
+            bytes: the header
+            bool: If True the node is a data-node (or unknown), else a container
+        """
+        header = reader.read(offset, NODE_HEADER_SIZE)
+        node.type, is_data = self._get_type(header)
+        node.size = unpack_node_size(header, 16)[0]
+        node.data_offset = offset + NODE_HEADER_SIZE
+        return header, is_data
+
+
+    def _add_to_node_index(self, node):
+        self.node_index.setdefault(node.type, []).append(node)
 
-        for _type, data in self.headers.items():
-            if data['header'] == tuple(header[0:4]):
-                return _type, data['is_data']
 
-        return "", True
+    def _build_node_index(self):
+        """ Fill the node_index from the node-tree (when it is not scanned). """
+        self.node_index = {}
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            self._add_to_node_index(node)
+            nodes.extend(reversed(node.children))
 
 
     def process(self, file_obj, node, indent=0):
         """Populate the node-tree.
 
-        Recursively build a node-tree of the items and containers we find in the
+        Build a node-tree of the items and containers we find in the
         tvpaint-file. The node-tree will be our structure to retreive data from.
 
+        The file is scanned in one pass, without recursion: the containers that
+        are being filled are kept on a stack. The headers are read in blocks
+        (see HeaderReader). Every node is also added to the flat 'node_index'
+        (type: nodes, in file-order).
+
         Args:
             file_obj(_io.BufferedReader): a tvpaint-file-object
-            node(Node): node-object
+            node(Node): node-object, its header is at the current position
             indent(int): indentation for printing the depth of our node(debugging)
         """
-
-        counter = 0
-        header = file_obj.read(24)  # read header-bytes
-        node.type, is_data = self._get_type(header)
-        node.size = struct.unpack_from(">Q", header, 16)[0]
+        self.node_index = {}
+        reader = HeaderReader(self)
+        header, is_data = self._read_node_header(reader, node, file_obj.tell())
+        self._add_to_node_index(node)
         if not node.type:
             logger.warning(f"Unknown header: {self.hext(header)}")
-            file_obj.seek(node.size, 1)
             return
-
-        # print treestructure as we process:
         logger.debug(f"{'----' * indent} {node.type} ({node.size} bytes)")
+        if is_data:
+            return
 
-        counter = 0
-        if not is_data:
-            while counter < node.size:
-                next_peek = file_obj.read(24)
-                next_size =  struct.unpack_from(">Q", next_peek, 16)[0]
-                file_obj.seek(-24, 1)
-                if self.validate_header(next_peek):
-                    counter += next_size + 24
-                    new_node = Node()
-                    node.add_child(new_node)
-                    self.process(file_obj, new_node, indent + 1)
-        else:
-            node.data_offset = file_obj.tell()
-            file_obj.seek(node.size, 1)
+        # [container, position of the next child, end of the container, depth]
+        stack = [[node, node.data_offset, node.data_offset + node.size, indent]]
+        while stack:
+            container = stack[-1]
+            parent, offset, end, depth = container
+            if offset >= end:
+                stack.pop()
+                continue
+
+            child = Node()
+            header, is_data = self._read_node_header(reader, child, offset)
+            if not self.validate_header(header):
+                logger.warning(
+                    f"Invalid header at {offset} in '{parent.type}': {self.hext(header)}"
+                )
+                stack.pop()
+                continue
+
+            parent.add_child(child)
+            self._add_to_node_index(child)
+            container[1] = child.data_offset + child.size
+            if not child.type:
+                logger.warning(f"Unknown header: {self.hext(header)}")
+                continue
+
+            # print treestructure as we process:
+            logger.debug(f"{'----' * (depth + 1)} {child.type} ({child.size} bytes)")
+            if not is_data:
+                stack.append(
+                    [child, child.data_offset, child.data_offset + child.size, depth + 1]
+                )
@@ -0,0 +1,235 @@
+"""Counters for the stages of the decoding&export-pipeline.
+
+The stages are measured with the module-level 'profiler', which does nothing
+until it is enabled (see --profile). Per stage it counts the calls, the time,
+and the bytes that go in and out:
+
+    with profiler.measure("inflate", len(data)) as measurement:
+        result = ...
+        measurement.bytes_out = len(result)
+
+Stages can be nested, the time of a stage excludes the time of the stages that
+are measured inside of it, so the times of all stages add up to the measured
+time. Measurements from threads are counted too, worker-processes send their
+counters back (see 'snapshot' and 'merge').
+
+Issued under the "do what you like with it - I take no responsibility" licence
+"""
+
+import sys
+import time
+import logging
+import threading
+import functools
+
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# stage: description, in pipeline-order
+STAGES = {
+    "scan": "structure-scan (nodes & chunks)",
+    "io": "chunk-I/O",
+    "inflate": "zlib-inflate (ZCHK)",
+    "rle_decode": "RLE-decode",
+    "cpy_resolve": "CPY-resolution (tile-sources)",
+    "assemble": "frame-assembly",
+    "composite": "layer-blending",
+    "color_convert": "color-conversion",
+    "png_encode": "PNG-encode",
+    "stream_write": "stream-write",
+    "npy_write": "npy-write",
+}
+COUNTERS = ("calls", "seconds", "bytes_in", "bytes_out")
+
+
+class _Measurement(object):
+    """ A running measurement of a stage, see Profiler.measure. """
+
+    __slots__ = ("profiler", "stage", "bytes_in", "bytes_out", "start", "child_seconds")
+
+    def __init__(self, profiler, stage, bytes_in):
+        self.profiler = profiler
+        self.stage = stage
+        self.bytes_in = bytes_in
+        self.bytes_out = 0
+        self.start = 0.0
+        self.child_seconds = 0.0
+
+    def __enter__(self):
+        self.profiler._active().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_args):
+        elapsed = time.perf_counter() - self.start
+        active = self.profiler._active()
+        active.pop()
+        if active:
+            active[-1].child_seconds += elapsed
+        self.profiler.add(
+            self.stage, elapsed - self.child_seconds, self.bytes_in, self.bytes_out
+        )
+
+
+class _NoMeasurement(object):
+    """ Returned by Profiler.measure when the profiler is disabled. """
+
+    bytes_out = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        pass
+
+
+_NO_MEASUREMENT = _NoMeasurement()
+
+
+class Profiler(object):
+    """ Collects the counters of the stages. """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}  # stage: {"calls", "seconds", "bytes_in", "bytes_out"}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _active(self):
+        """ The stack of running measurements of the current thread. """
+        try:
+            return self._local.active
+        except AttributeError:
+            self._local.active = []
+            return self._local.active
+
+    def measure(self, stage, bytes_in=0):
+        """ Return a context-manager that measures a stage.
+
+        Set 'bytes_out' on the returned object to count the produced bytes.
+
+        Args:
+            stage (str): name of the stage (see STAGES)
+            bytes_in (int): amount of bytes that go into the stage
+
+        Returns:
+            context-manager
+        """
+        if not self.enabled:
+            return _NO_MEASUREMENT
+        return _Measurement(self, stage, bytes_in)
+
+    def add(self, stage, seconds, bytes_in=0, bytes_out=0, calls=1):
+        """ Add to the counters of a stage. """
+        with self._lock:
+            counters = self.stages.get(stage)
+            if counters is None:
+                counters = self.stages[stage] = dict.fromkeys(COUNTERS, 0)
+            counters["calls"] += calls
+            counters["seconds"] += seconds
+            counters["bytes_in"] += bytes_in
+            counters["bytes_out"] += bytes_out
+
+    def merge(self, stages):
+        """ Add the counters of another profiler (a snapshot of a worker). """
+        for stage, counters in stages.items():
+            self.add(
+                stage, counters["seconds"], counters["bytes_in"],
+                counters["bytes_out"], counters["calls"]
+            )
+
+    def snapshot(self, reset=True):
+        """ Return a copy of the counters.
+
+        Args:
+            reset (bool): clear the counters, so they are not sent twice
+
+        Returns:
+            dict: stage: counters
+        """
+        with self._lock:
+            stages = {stage: dict(counters) for stage, counters in self.stages.items()}
+            if reset:
+                self.stages = {}
+        return stages
+
+    def report(self, wall_seconds=None):
+        """ Return the counters with the throughput per stage.
+
+        Args:
+            wall_seconds (float): the total time of the run
+
+        Returns:
+            dict: {"wall_seconds", "stages": {stage: counters, mb_in_per_s,
+                mb_out_per_s, description}}
+        """
+        stages = {}
+        for stage, counters in sorted(
+            self.snapshot(reset=False).items(), key=lambda item: _stage_order(item[0])
+        ):
+            seconds = counters["seconds"]
+            stages[stage] = dict(
+                counters,
+                description=STAGES.get(stage, stage),
+                mb_in_per_s=counters["bytes_in"] / 1e6 / seconds if seconds else None,
+                mb_out_per_s=counters["bytes_out"] / 1e6 / seconds if seconds else None,
+            )
+        return {"wall_seconds": wall_seconds, "stages": stages}
+
+    def format_table(self, wall_seconds=None):
+        """ Return the report as a table (str). """
+        report = self.report(wall_seconds)
+        stages = report["stages"]
+        total = sum(counters["seconds"] for counters in stages.values())
+
+        def rate(value):
+            return f"{value:10.1f}" if value is not None else f"{'-':>10}"
+
+        lines = [
+            f"{'stage':<32}{'calls':>9}{'seconds':>10}{'%':>7}"
+            f"{'MB in':>10}{'MB out':>10}{'MB/s in':>10}{'MB/s out':>10}"
+        ]
+        for counters in stages.values():
+            share = counters["seconds"] / total * 100 if total else 0.0
+            lines.append(
+                f"{counters['description']:<32}{counters['calls']:9d}"
+                f"{counters['seconds']:10.4f}{share:7.1f}"
+                f"{counters['bytes_in'] / 1e6:10.2f}{counters['bytes_out'] / 1e6:10.2f}"
+                f"{rate(counters['mb_in_per_s'])}{rate(counters['mb_out_per_s'])}"
+            )
+        lines.append(f"{'measured':<32}{'':>9}{total:10.4f}")
+        if wall_seconds is not None:
+            lines.append(f"{'wall-time':<32}{'':>9}{wall_seconds:10.4f}")
+        return "\n".join(lines)
+
+
+def _stage_order(stage):
+    stages = list(STAGES)
+    return stages.index(stage) if stage in stages else len(stages)
+
+
+def profiled(stage, bytes_in=len, bytes_out=len):
+    """ Decorator: measure a function as a stage.
+
+    Args:
+        stage (str): name of the stage
+        bytes_in (function): gets the first argument, returns the bytes in
+        bytes_out (function): gets the result, returns the bytes out
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(data, *args, **kwargs):
+            if not profiler.enabled:
+                return func(data, *args, **kwargs)
+            with profiler.measure(stage, bytes_in(data)) as measurement:
+                result = func(data, *args, **kwargs)
+                measurement.bytes_out = bytes_out(result)
+            return result
+        return wrapper
+    return decorator
+
+
+profiler = Profiler()